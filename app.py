@@ -1,10 +1,23 @@
 # app.py
 # Importando as bibliotecas necessárias
 import streamlit as st
-import pandas as pd
-import sqlite3
-from datetime import datetime
+import hmac
+import io
 import os
+from datetime import date, timedelta
+
+import arquivamento
+import exportacao
+import instrumentacao
+import repositorio
+from base_dados import DB_FILE_PATH, GERACAO_CHAMADOS, GERACAO_EQUIPAMENTOS
+from migracoes import TABELA_EQUIPAMENTOS
+from repositorio import (COLUNAS_CSV_LOTE, STATUS_CHAMADO, TIPOS_PROBLEMA, Equipamento, save_chamado,
+                         ConflitoVersao, save_chamados_em_lote, update_chamado_details, validar_lote_csv)
+
+# Tempos deste rerun, por secção e por função de dados (ver o painel de desempenho)
+instrumentacao.iniciar_medicao("rerun")
+instrumentacao.seccao("configuracao")
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -128,160 +141,492 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
-# --- GESTÃO DA BASE DE DADOS DE CHAMADOS ---
-
-def init_chamados_db():
-    conn = sqlite3.connect('chamados.db')
-    c = conn.cursor()
-
-    # Garante que a tabela 'chamados' exista com a estrutura mínima
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS chamados (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            municipio TEXT,
-            imei1 TEXT,
-            imei2 TEXT,
-            marca TEXT,
-            modelo TEXT,
-            capacidade TEXT,
-            entrega TEXT,
-            local_uso TEXT,
-            situacao_equipamento TEXT,
-            patrimonio TEXT,
-            solicitante_nome TEXT,
-            solicitante_telefone TEXT,
-            tipo_problema TEXT,
-            relato_problema TEXT
-        )
-    ''')
-
-    # Verifica e adiciona colunas faltantes de forma segura
-    c.execute("PRAGMA table_info(chamados)")
-    existing_columns = [info[1] for info in c.fetchall()]
-
-    if 'status' not in existing_columns:
-        c.execute("ALTER TABLE chamados ADD COLUMN status TEXT DEFAULT 'Aberto'")
-    if 'solucao' not in existing_columns:
-        c.execute("ALTER TABLE chamados ADD COLUMN solucao TEXT DEFAULT ''")
-
-    conn.commit()
-    conn.close()
-
-
-def save_chamado(dados_equipamento, dados_formulario, municipio_col_name):
-    conn = sqlite3.connect('chamados.db')
-    c = conn.cursor()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    data_to_insert = (
-        now,
-        dados_equipamento[municipio_col_name],
-        str(dados_equipamento.get('IMEI1', '')),
-        str(dados_equipamento.get('IMEI2', '')),
-        dados_equipamento.get('Marca', ''),
-        dados_equipamento.get('Modelo', ''),
-        dados_equipamento.get('Capacidade', ''),
-        dados_equipamento.get('Entrega', ''),
-        dados_equipamento.get('Local de Uso', ''),
-        dados_equipamento.get('Situação', ''),
-        str(dados_equipamento.get('Patrimonio', '')),
-        dados_formulario['nome'],
-        dados_formulario['telefone'],
-        dados_formulario['tipo_problema'],
-        dados_formulario['relato'],
-        'Aberto',  # Status inicial
-        ''  # Solução inicial vazia
-    )
-
-    c.execute('''
-        INSERT INTO chamados (
-            timestamp, municipio, imei1, imei2, marca, modelo, capacidade, 
-            entrega, local_uso, situacao_equipamento, patrimonio, 
-            solicitante_nome, solicitante_telefone, tipo_problema, relato_problema, status, solucao
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', data_to_insert)
-
-    conn.commit()
-    conn.close()
-
-
-def carregar_chamados_por_municipio(municipio):
-    conn = sqlite3.connect('chamados.db')
-    try:
-        query = "SELECT id as ID, timestamp as Data, patrimonio as Património, tipo_problema as Problema, relato_problema as Relato, status as Status FROM chamados WHERE municipio = ? ORDER BY id DESC"
-        df_chamados = pd.read_sql_query(query, conn, params=(municipio,))
-        return df_chamados
-    except Exception as e:
-        st.warning(f"Não foi possível carregar os chamados existentes: {e}")
-        return pd.DataFrame()
-    finally:
-        conn.close()
+# --- VALORES FIXOS DA INTERFACE ---
+# Opções de número de chamados por página na listagem (a primeira é a predefinida)
+TAMANHOS_PAGINA = [25, 50, 100]
+# Número máximo de consultas de chamados guardadas em cache (por geração dos dados)
+MAX_CONSULTAS_CHAMADOS_EM_CACHE = 256
+# Vistas da aplicação, escolhidas na barra lateral
+VISTAS = ["📝 Registo de Ocorrências", "📊 Estatísticas"]
+# Token de administração (?admin=<token> no URL) que mostra o painel de desempenho; vazio = painel desligado
+TOKEN_ADMIN = os.environ.get('SUPORTE_TOKEN_ADMIN', '')
+# Períodos do painel de estatísticas (dias para trás a partir de hoje; None = todo o histórico)
+PERIODOS_ESTATISTICAS = {"Todo o histórico": None, "Últimos 30 dias": 30, "Últimos 90 dias": 90, "Último ano": 365}
+# Linhas mostradas na lista dos chamados encerrados no período
+MAX_LINHAS_ENCERRADOS_PERIODO = 500
+# O botão de download guarda o ficheiro inteiro em memória; acima disto, usar o exportacao.py na linha de comandos
+MAX_LINHAS_EXPORTACAO_APP = 200000
 
 
-def carregar_detalhes_chamado(chamado_id):
-    conn = sqlite3.connect('chamados.db')
-    try:
-        query = "SELECT * FROM chamados WHERE id = ?"
-        df_chamado = pd.read_sql_query(query, conn, params=(chamado_id,))
-        return df_chamado.iloc[0] if not df_chamado.empty else None
-    finally:
-        conn.close()
+# --- LEITURAS EM CACHE DOS CHAMADOS ---
+# O acesso aos dados vive no módulo 'repositorio' (sem Streamlit); aqui ficam só
+# as caches, que recebem a geração como argumento: uma escrita ou importação
+# incrementa a geração e gera automaticamente uma nova entrada.
 
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def carregar_chamados_por_municipio(municipio, status=None, tipo_problema=None, antes_de_id=None,
+                                    limite=TAMANHOS_PAGINA[0], incluir_arquivo=False, desde=None, ate=None,
+                                    geracao=0):
+    # Sem try/except aqui: um erro passageiro (ex.: base bloqueada) não pode ficar em cache
+    return repositorio.carregar_chamados_por_municipio(municipio, status, tipo_problema, antes_de_id, limite,
+                                                       incluir_arquivo, desde, ate)
 
-def update_chamado_details(chamado_id, novo_status, nova_solucao):
-    conn = sqlite3.connect('chamados.db')
-    c = conn.cursor()
-    c.execute("UPDATE chamados SET status = ?, solucao = ? WHERE id = ?", (novo_status, nova_solucao, chamado_id))
-    conn.commit()
-    conn.close()
 
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def pesquisar_chamados(termo, pagina=0, limite=TAMANHOS_PAGINA[0], geracao=0):
+    return repositorio.pesquisar_chamados(termo, pagina, limite)
 
-init_chamados_db()
 
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def contar_chamados(municipio, incluir_arquivo=False, geracao=0):
+    return repositorio.contar_chamados(municipio, incluir_arquivo)
+
+
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def carregar_detalhes_chamado(chamado_id, geracao=0):
+    return repositorio.carregar_detalhes_chamado(chamado_id)
+
+
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def carregar_chamados_abertos_equipamento(chave, geracao=0):
+    return repositorio.carregar_chamados_abertos_equipamento(chave)
 
-# --- CARREGAMENTO DOS DADOS DA BASE DE DADOS DE EQUIPAMENTOS ---
-@st.cache_data
-def carregar_dados_do_db():
-    DB_FILE_PATH = 'chamados.db'
-    TABLE_NAME = 'equipamentos'
 
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def carregar_chamados_ultimos_dias(dias, encerrados=False, municipio=None, limite=None, geracao=0):
+    return repositorio.carregar_chamados_ultimos_dias(dias, encerrados, municipio, limite)
+
+
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def carregar_estatisticas(agrupar_por, municipio=None, desde=None, ate=None, geracao=0):
+    return repositorio.carregar_estatisticas(agrupar_por, municipio, desde, ate)
+
+
+# --- ARRANQUE DO PROCESSO ---
+# O Streamlit volta a executar este ficheiro a cada interação. O que só precisa
+# de ser feito uma vez por processo fica em cache_resource; a cada rerun resta
+# ler as gerações (uma consulta) e o que a vista atual mostrar. O pandas só é
+# importado quando uma leitura em massa precisa dele.
+
+@st.cache_resource
+def arrancar_processo():
+    # Esquema da base de dados (migrações); uma falha não fica em cache e volta a ser tentada
+    repositorio.inicializar_base_dados()
+    # Os chamados encerrados antigos passam para o arquivo numa thread, em lotes pequenos
+    arquivamento.iniciar_arquivamento_periodico()
+
+
+instrumentacao.seccao("arranque")
+arrancar_processo()
+geracoes = repositorio.obter_geracoes()
+
+
+# --- CARREGAMENTO DOS DADOS DA BASE DE DADOS DE EQUIPAMENTOS ---
+# 'preguicoso': só a lista de municípios fica em memória; os equipamentos de cada
+# município são lidos a pedido (consulta indexada) e guardados numa cache LRU limitada.
+# 'completo': a tabela inteira é carregada uma vez e filtrada em memória.
+CARREGAMENTO_EQUIPAMENTOS = os.environ.get('SUPORTE_CARREGAMENTO_EQUIPAMENTOS', 'preguicoso')
+# Número máximo de municípios mantidos na cache do modo preguiçoso
+MAX_MUNICIPIOS_EM_CACHE = 32
+
+
+def _verificar_base_equipamentos():
+    if not repositorio.tabela_equipamentos_existe():
+        st.error(f"**Tabela de Equipamentos não encontrada!** A tabela `{TABELA_EQUIPAMENTOS}` não existe na base de dados.")
+        st.info("Por favor, execute o script `importar_dados.py` para importar os dados do seu CSV.")
+        return False
+    return True
+
+
+@st.cache_resource(max_entries=1)
+def carregar_dados_do_db(geracao=0):
+    """
+    Carrega a tabela de equipamentos uma única vez por processo. O DataFrame
+    devolvido é partilhado por todas as sessões (sem cópias por sessão), pelo
+    que é só de leitura: quem precisar de o alterar deve filtrar ou copiar antes.
+    Só a geração mais recente fica em memória (max_entries=1).
+    """
     if not os.path.exists(DB_FILE_PATH):
         st.error(f"**Base de Dados não encontrada!** Verifique se o ficheiro `{DB_FILE_PATH}` existe.")
         st.info("Por favor, execute primeiro o script `importar_dados.py` para criar a base de dados.")
         return None
 
     try:
-        conn = sqlite3.connect(DB_FILE_PATH)
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{TABLE_NAME}';")
-        if cursor.fetchone() is None:
-            st.error(f"**Tabela de Equipamentos não encontrada!** A tabela `{TABLE_NAME}` não existe na base de dados.")
-            st.info("Por favor, execute o script `importar_dados.py` para importar os dados do seu CSV.")
-            conn.close()
+        if not _verificar_base_equipamentos():
             return None
+        return repositorio.carregar_tabela_equipamentos()
+    except Exception as e:
+        st.error(f"**Ocorreu um erro ao ler a base de dados:** {e}")
+        st.info("A base de dados pode estar corrompida. Tente executar `importar_dados.py` novamente.")
+        return None
 
-        df = pd.read_sql_query(f"SELECT * FROM {TABLE_NAME}", conn)
-        conn.close()
-        return df
+
+@st.cache_resource(max_entries=1)
+def carregar_municipios(geracao=0):
+    """
+    Devolve (coluna de municípios, opções da caixa de seleção já com
+    "Selecione..."), ou None se a tabela não existir. Calculado uma vez por
+    geração e partilhado por todas as sessões, sem cópia a cada rerun.
+    """
+    try:
+        if not _verificar_base_equipamentos():
+            return None
+        municipio_col, municipios = repositorio.listar_municipios()
+        return municipio_col, tuple(["Selecione..."] + municipios)
     except Exception as e:
         st.error(f"**Ocorreu um erro ao ler a base de dados:** {e}")
         st.info("A base de dados pode estar corrompida. Tente executar `importar_dados.py` novamente.")
         return None
 
 
-df_equipamentos = carregar_dados_do_db()
+@st.cache_resource(max_entries=MAX_MUNICIPIOS_EM_CACHE)
+def carregar_equipamentos_municipio(municipio, municipio_col_name, geracao=0):
+    # Partilhado entre sessões (sem desserializar uma cópia a cada rerun): só de leitura
+    return repositorio.carregar_equipamentos_municipio(municipio, municipio_col_name)
+
+
+@st.cache_resource(max_entries=1)
+def indice_identificadores(geracao=0):
+    # Partilhado por todas as sessões; só a geração mais recente fica em memória
+    return repositorio.construir_indice_identificadores()
+
+
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def carregar_equipamento(rowid, geracao=0):
+    return repositorio.carregar_equipamento(rowid)
+
+
+@st.cache_data(max_entries=MAX_CONSULTAS_CHAMADOS_EM_CACHE)
+def procurar_equipamentos(termo, geracao=0):
+    return repositorio.procurar_equipamentos(termo, indice_identificadores(geracao))
+
+
+def memoria_equipamentos_mb():
+    # Memória ocupada pelo DataFrame partilhado do modo completo
+    df_equipamentos = carregar_dados_do_db(geracoes[GERACAO_EQUIPAMENTOS])
+    if df_equipamentos is None:
+        return 0.0
+    return df_equipamentos.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def equipamentos_do_municipio(municipio, municipio_col_name):
+    if CARREGAMENTO_EQUIPAMENTOS == 'completo':
+        df_equipamentos = carregar_dados_do_db(geracoes[GERACAO_EQUIPAMENTOS])
+        if df_equipamentos is None:
+            import pandas as pd
+
+            return pd.DataFrame()
+        return df_equipamentos[df_equipamentos[municipio_col_name] == municipio]
+    return carregar_equipamentos_municipio(municipio, municipio_col_name, geracoes[GERACAO_EQUIPAMENTOS])
+
+
+@st.cache_resource(max_entries=MAX_MUNICIPIOS_EM_CACHE)
+def descricoes_equipamentos(municipio, municipio_col_name, geracao=0):
+    # Texto de cada opção da caixa de seleção, por índice do DataFrame do município
+    dados = equipamentos_do_municipio(municipio, municipio_col_name)
+    return {index: descrever_equipamento(linha) for index, linha in dados.to_dict('index').items()}
+
+
+instrumentacao.seccao("catalogo_municipios")
+catalogo_municipios = carregar_municipios(geracoes[GERACAO_EQUIPAMENTOS])
+
+# --- COMPONENTES DA INTERFACE ---
+def mostrar_linha_chamado(row, prefixo_chave='edit_btn'):
+    # Uma linha da lista de chamados, com o botão para abrir a edição
+    col1, col2, col3, col4 = st.columns([1, 2, 3, 1])
+    with col1:
+        st.markdown(f"**ID:** {row['ID']}<br>**Data:** {row['Data'].split(' ')[0]}",
+                    unsafe_allow_html=True)
+    with col2:
+        municipio = f"**Município:** {row['Município']}<br>" if 'Município' in row else ""
+        st.markdown(f"{municipio}**Património:** {row['Património']}<br>**Status:** {row['Status']}",
+                    unsafe_allow_html=True)
+    with col3:
+        if 'Trecho' in row:
+            texto = f"**Trecho:** {row['Trecho']}"
+        else:
+            texto = f"**Relato:** {row['Relato'][:40]}..."
+        st.markdown(f"**Problema:** {row['Problema']}<br>{texto}",
+                    unsafe_allow_html=True)
+    with col4:
+        if st.button("Editar", key=f"{prefixo_chave}_{row['ID']}", use_container_width=True):
+            st.session_state.editing_chamado_id = row['ID']
+            # A versão do chamado é guardada quando a edição começa (ver o modo de edição)
+            st.session_state.editing_versao = None
+            st.rerun()
+    st.markdown("---")
+
+
+def descrever_equipamento(row):
+    return f"Património: {row.get('Patrimonio', 'N/A')} | Modelo: {row.get('Marca', '')} {row.get('Modelo', '')} | Local: {row.get('Local de Uso', '')}"
+
+
+def mostrar_formulario_novo_chamado(equipamento):
+    instrumentacao.seccao("formulario_novo_chamado")
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    st.subheader("3. Preencha os Dados do Novo Chamado")
+
+    st.markdown("**Detalhes do Equipamento Selecionado:**")
+    detalhes_html = "<div class='details-grid'>"
+    for label, value in equipamento.como_dicionario().items():
+        detalhes_html += f"<div class='item'><span class='label'>{label}</span> <span class='value'>{value}</span></div>"
+    detalhes_html += "</div>"
+    st.markdown(detalhes_html, unsafe_allow_html=True)
+
+    st.markdown("**Informações do Solicitante e do Problema:**")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.text_input("Nome do Solicitante:", key="form_nome")
+        st.text_input("Telefone de Contacto:", key="form_telefone")
+        st.selectbox(
+            "Tipo de Problema:",
+            [""] + TIPOS_PROBLEMA,
+            key="form_tipo_problema"
+        )
+    with col2:
+        st.text_area("Breve relato do problema:", height=155, key="form_relato")
+
+    if st.button("✔️ Registar Chamado", use_container_width=True):
+        nome = st.session_state.form_nome
+        telefone = st.session_state.form_telefone
+        tipo_problema = st.session_state.form_tipo_problema
+        relato = st.session_state.form_relato
+
+        if nome and telefone and tipo_problema and relato:
+            dados_formulario = {
+                "nome": nome,
+                "telefone": telefone,
+                "tipo_problema": tipo_problema,
+                "relato": relato
+            }
+            patrimonio_str = equipamento.patrimonio or 'N/A'
+            save_chamado(equipamento, dados_formulario)
+
+            st.session_state.success_message = f"Chamado para o equipamento de património **{patrimonio_str}** registado com sucesso!"
+            st.session_state.form_submitted = True
+            st.rerun()
+        else:
+            st.warning("⚠️ Por favor, preencha todos os campos do formulário.", icon="❗")
+
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def _registar_lote(df_lote, municipio_col_name):
+    total = save_chamados_em_lote(df_lote, municipio_col_name)
+    st.session_state.success_message = f"{total} chamados registados com sucesso numa única operação!"
+    # Muda a chave dos widgets do lote para os limpar (inclui o ficheiro carregado)
+    st.session_state.lote_versao += 1
+    st.rerun()
+
+
+def mostrar_registo_em_lote(municipio_col_name, dados_filtrados=None, descricoes=None):
+    # Registo de vários chamados de uma vez: por ficheiro CSV ou escolhendo vários equipamentos
+    instrumentacao.seccao("registo_em_lote")
+    if 'lote_versao' not in st.session_state:
+        st.session_state.lote_versao = 0
+    versao = st.session_state.lote_versao
+
+    with st.expander("📦 Registar Chamados em Lote"):
+        aba_csv, aba_equipamentos = st.tabs(["Ficheiro CSV", "Vários equipamentos do município"])
+
+        with aba_csv:
+            st.caption("Ficheiro separado por ';' com as colunas Patrimonio (ou IMEI1), "
+                       f"{', '.join(COLUNAS_CSV_LOTE)}. Tipos aceites: {', '.join(TIPOS_PROBLEMA)}.")
+            ficheiro = st.file_uploader("Ficheiro CSV:", type='csv', key=f"lote_csv_{versao}")
+            if ficheiro is not None:
+                import pandas as pd
+
+                try:
+                    validos, erros = validar_lote_csv(pd.read_csv(ficheiro, sep=';', dtype=str))
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.markdown(f"**{len(validos)}** linhas válidas, **{len(erros)}** com erros.")
+                    if not erros.empty:
+                        st.dataframe(erros, hide_index=True, use_container_width=True)
+                    if not validos.empty and st.button(f"✔️ Registar {len(validos)} Chamados", key=f"lote_csv_btn_{versao}",
+                                                       use_container_width=True):
+                        _registar_lote(validos, municipio_col_name)
+
+        with aba_equipamentos:
+            if dados_filtrados is None or dados_filtrados.empty:
+                st.info("Selecione um município na barra lateral para escolher os equipamentos.")
+                return
+
+            selecionados = st.multiselect("Equipamentos:", options=list(dados_filtrados.index),
+                                          format_func=descricoes.get,
+                                          key=f"lote_equipamentos_{versao}")
+            col1, col2 = st.columns(2)
+            with col1:
+                nome = st.text_input("Nome do Solicitante:", key=f"lote_nome_{versao}")
+                telefone = st.text_input("Telefone de Contacto:", key=f"lote_telefone_{versao}")
+                tipo_problema = st.selectbox("Tipo de Problema:", [""] + TIPOS_PROBLEMA, key=f"lote_tipo_{versao}")
+            with col2:
+                relato = st.text_area("Breve relato do problema:", height=155, key=f"lote_relato_{versao}")
+
+            if st.button(f"✔️ Registar {len(selecionados)} Chamados", key=f"lote_equip_btn_{versao}",
+                         disabled=not selecionados, use_container_width=True):
+                if nome and telefone and tipo_problema and relato:
+                    df_lote = dados_filtrados.loc[selecionados].assign(**{
+                        'Solicitante': nome, 'Telefone': telefone, 'Tipo de Problema': tipo_problema, 'Relato': relato
+                    })
+                    _registar_lote(df_lote, municipio_col_name)
+                else:
+                    st.warning("⚠️ Por favor, preencha todos os campos do formulário.", icon="❗")
+
+
+def _tabela_por_status(df, coluna):
+    # Linhas por 'coluna', uma coluna por status (pela ordem de STATUS_CHAMADO) e o total
+    tabela = df.pivot_table(index=coluna, columns='status', values='total', aggfunc='sum', fill_value=0)
+    tabela = tabela.reindex(columns=STATUS_CHAMADO, fill_value=0)
+    tabela['Total'] = tabela.sum(axis=1)
+    return tabela
+
+
+def mostrar_painel_estatisticas():
+    # Todas as contagens vêm da tabela resumo (uma linha por grupo), nunca da tabela chamados
+    instrumentacao.seccao("painel_estatisticas")
+    st.title("📊 Estatísticas dos Chamados")
+    geracao = geracoes[GERACAO_CHAMADOS]
+
+    municipios = carregar_estatisticas(('municipio',), geracao=geracao)['municipio'].tolist()
+    col_municipio, col_periodo = st.columns(2)
+    with col_municipio:
+        municipio = st.selectbox("Município:", ["Todos"] + municipios, key='estatisticas_municipio')
+    with col_periodo:
+        periodo = st.selectbox("Abertos em:", list(PERIODOS_ESTATISTICAS), key='estatisticas_periodo')
+    municipio = None if municipio == "Todos" else municipio
+    dias = PERIODOS_ESTATISTICAS[periodo]
+    desde = (date.today() - timedelta(days=dias)).isoformat() if dias else None
+
+    por_status = carregar_estatisticas(('status',), municipio, desde, geracao=geracao)
+    totais = dict(zip(por_status['status'], por_status['total']))
+    colunas = st.columns(len(STATUS_CHAMADO) + 1)
+    colunas[0].metric("Total", int(por_status['total'].sum()))
+    for coluna, status in zip(colunas[1:], STATUS_CHAMADO):
+        coluna.metric(status, int(totais.get(status, 0)))
+
+    if dias:
+        # Os encerramentos vêm do índice de encerrado_ts (a tabela resumo só conhece a data de abertura)
+        with st.expander(f"✅ Chamados Encerrados ({periodo})"):
+            encerrados = carregar_chamados_ultimos_dias(dias, True, municipio, MAX_LINHAS_ENCERRADOS_PERIODO,
+                                                        geracao=geracao)
+            if encerrados.empty:
+                st.info("Nenhum chamado encerrado neste período.")
+            else:
+                st.dataframe(encerrados, hide_index=True, use_container_width=True)
+                if len(encerrados) == MAX_LINHAS_ENCERRADOS_PERIODO:
+                    st.caption(f"Só os {MAX_LINHAS_ENCERRADOS_PERIODO} encerrados mais recentes.")
+
+    mostrar_exportacao(municipio, geracao)
+
+    if por_status.empty:
+        st.info("Nenhum chamado no período selecionado.")
+        return
+
+    st.subheader("Chamados abertos por dia")
+    por_dia = carregar_estatisticas(('dia', 'status'), municipio, desde, geracao=geracao)
+    st.bar_chart(_tabela_por_status(por_dia, 'dia')[STATUS_CHAMADO])
+
+    st.subheader("Por tipo de problema")
+    por_tipo = carregar_estatisticas(('tipo_problema', 'status'), municipio, desde, geracao=geracao)
+    st.dataframe(_tabela_por_status(por_tipo, 'tipo_problema'), use_container_width=True)
+
+    if municipio is None:
+        st.subheader("Por município")
+        por_municipio = _tabela_por_status(carregar_estatisticas(('municipio', 'status'), None, desde, geracao=geracao),
+                                           'municipio')
+        st.dataframe(por_municipio.sort_values(STATUS_CHAMADO[0], ascending=False), use_container_width=True)
+
+
+def mostrar_exportacao(municipio, geracao):
+    # Os chamados do município escolhido, com estado e período próprios, em CSV ou Parquet
+    with st.expander("📤 Exportar Chamados"):
+        col_status, col_periodo, col_formato = st.columns(3)
+        with col_status:
+            status = st.selectbox("Estado:", ["Todos"] + STATUS_CHAMADO, key='exportacao_status')
+        with col_periodo:
+            periodo = st.date_input("Abertos entre:", (date.today() - timedelta(days=30), date.today()),
+                                    key='exportacao_periodo')
+        with col_formato:
+            formatos = exportacao.FORMATOS if exportacao.parquet_disponivel() else ('csv',)
+            formato = st.radio("Formato:", formatos, format_func=str.upper, horizontal=True, key='exportacao_formato')
+
+        if len(periodo) != 2:
+            st.info("Escolha o último dia do período.")
+            return
+        status = None if status == "Todos" else status
+        desde, ate = (dia.isoformat() for dia in periodo)
+
+        # A contagem vem da tabela resumo; o ficheiro só é gerado quando se carrega no botão
+        por_status = carregar_estatisticas(('status',), municipio, desde, ate, geracao=geracao)
+        if status:
+            por_status = por_status[por_status['status'] == status]
+        total = int(por_status['total'].sum())
+        if total > MAX_LINHAS_EXPORTACAO_APP:
+            st.warning(f"{total} chamados é demasiado para descarregar pela aplicação (máximo "
+                       f"{MAX_LINHAS_EXPORTACAO_APP}). Reduza o período ou use o exportacao.py na linha de comandos.")
+            return
+
+        def gerar_ficheiro():
+            destino = io.BytesIO()
+            exportacao.exportar_chamados(destino, formato, municipio, status, desde, ate)
+            return destino.getvalue()
+
+        nome = f"chamados_{municipio or 'todos'}_{desde}_{ate}.{formato}".replace(' ', '_')
+        st.download_button(f"⬇️ Descarregar {total} Chamados ({formato.upper()})", gerar_ficheiro, file_name=nome,
+                           mime='text/csv' if formato == 'csv' else 'application/vnd.apache.parquet',
+                           on_click='ignore', disabled=total == 0, use_container_width=True)
+
+
+def mostrar_painel_desempenho(resumo):
+    # Para quem precisa de saber onde o rerun gastou o tempo: secções, funções de dados e consultas lentas
+    with st.sidebar.expander(f"⏱️ Desempenho: {resumo['total_ms']:.0f} ms neste rerun"):
+        st.caption("Secções da página (inclui o tempo de desenho)")
+        st.dataframe([{"Secção": nome, "ms": ms} for nome, ms in resumo['seccoes'].items()],
+                     hide_index=True, use_container_width=True)
+        st.caption("Funções de dados executadas (as respondidas pela cache não aparecem)")
+        st.dataframe([{"Função": nome, "Chamadas": dados['chamadas'], "ms": dados['ms'], "Linhas": dados['linhas']}
+                      for nome, dados in resumo['funcoes'].items()],
+                     hide_index=True, use_container_width=True)
+
+    lentas = instrumentacao.consultas_lentas()
+    with st.sidebar.expander(f"🐢 {len(lentas)} Consultas Lentas (> {instrumentacao.LIMIAR_LENTO_MS:.0f} ms)"):
+        for lenta in lentas:
+            st.markdown(f"**{lenta['funcao']}**: {lenta['ms']:.0f} ms, {lenta['linhas']} linhas ({lenta['data']})")
+            for consulta in lenta['consultas']:
+                plano = consulta.get('plano') or [consulta.get('erro', '')]
+                st.code(consulta['sql'] + "\n-- " + "\n-- ".join(plano), language='sql')
+
 
 # --- GESTÃO DE ESTADO ---
 if 'editing_chamado_id' not in st.session_state:
     st.session_state.editing_chamado_id = None
 
+
+def on_vista_change():
+    st.session_state.editing_chamado_id = None
+
+
+vista = st.sidebar.radio("Vista:", VISTAS, key='vista', on_change=on_vista_change)
+
 # --- MODO DE EDIÇÃO DE CHAMADO ---
 if st.session_state.editing_chamado_id is not None:
+    instrumentacao.seccao("edicao_chamado")
     chamado_id = st.session_state.editing_chamado_id
-    chamado_details = carregar_detalhes_chamado(chamado_id)
+    chamado_details = carregar_detalhes_chamado(chamado_id, geracoes[GERACAO_CHAMADOS])
+    # Versão lida quando a edição começou: se outro operador gravar entretanto, a gravação é recusada
+    if chamado_details is not None and st.session_state.get('editing_versao') is None:
+        st.session_state.editing_versao = chamado_details.versao
 
     st.title("✍️ Editar Ocorrência")
+    conflito = st.session_state.get('conflito_edicao')
+    if conflito and conflito[0] == chamado_id:
+        st.error(f"Outro operador alterou este chamado enquanto o editava e as suas alterações não foram "
+                 f"gravadas. Os dados abaixo são os atuais; reveja-os e volte a guardar.\n\n"
+                 f"O que tentou gravar: **{conflito[1]}**: {conflito[2]}", icon="⚠️")
+        st.session_state.conflito_edicao = None
 
     if st.button("⬅️ Voltar para a lista"):
         st.session_state.editing_chamado_id = None
@@ -293,7 +638,7 @@ if st.session_state.editing_chamado_id is not None:
             st.subheader(f"Detalhes do Chamado ID: {chamado_id}")
 
             detalhes_html = "<div class='details-grid'>"
-            for label, value in chamado_details.items():
+            for label, value in chamado_details.como_dicionario().items():
                 if label != 'id':
                     detalhes_html += f"<div class='item'><span class='label'>{label}</span> <span class='value'>{value}</span></div>"
             detalhes_html += "</div>"
@@ -302,23 +647,32 @@ if st.session_state.editing_chamado_id is not None:
             st.markdown("---")
             st.subheader("Registar Solução e Alterar Status")
 
-            status_options = ["Aberto", "Aguardando solução", "Encerrado"]
             try:
-                current_status_index = status_options.index(chamado_details['status'])
+                current_status_index = STATUS_CHAMADO.index(chamado_details.status)
             except ValueError:
                 current_status_index = 0
 
-            novo_status = st.selectbox("Status do Chamado:", options=status_options, index=current_status_index)
-            nova_solucao = st.text_area("Descrição da Solução:", value=chamado_details['solucao'], height=150)
+            novo_status = st.selectbox("Status do Chamado:", options=STATUS_CHAMADO, index=current_status_index)
+            nova_solucao = st.text_area("Descrição da Solução:", value=chamado_details.solucao, height=150)
 
             if st.button("Salvar Alterações", use_container_width=True):
-                update_chamado_details(chamado_id, novo_status, nova_solucao)
+                try:
+                    update_chamado_details(chamado_id, novo_status, nova_solucao, st.session_state.editing_versao)
+                except ConflitoVersao:
+                    # Os detalhes acima passam a mostrar a versão atual; a próxima gravação parte dela
+                    st.session_state.editing_versao = None
+                    st.session_state.conflito_edicao = (chamado_id, novo_status, nova_solucao)
+                    st.rerun()
                 st.session_state.success_message = f"Chamado {chamado_id} atualizado com sucesso!"
                 st.session_state.editing_chamado_id = None
                 st.rerun()
 
             st.markdown('</div>', unsafe_allow_html=True)
 
+# --- PAINEL DE ESTATÍSTICAS ---
+elif vista == VISTAS[1]:
+    mostrar_painel_estatisticas()
+
 # --- MODO PRINCIPAL (LISTAGEM E CRIAÇÃO) ---
 else:
     st.title("🖥️ Sistema de Registo de Ocorrências")
@@ -327,9 +681,46 @@ else:
         st.success(st.session_state.success_message, icon="✅")
         st.session_state.success_message = None
 
-    if df_equipamentos is not None:
-        municipio_col_name = next((name for name in ['Município', 'Municipio'] if name in df_equipamentos.columns),
-                                  None)
+    # --- PESQUISA DE CHAMADOS EM TODOS OS MUNICÍPIOS ---
+    instrumentacao.seccao("pesquisa_chamados")
+
+    def reiniciar_pesquisa():
+        st.session_state.pesquisa_pagina = 0
+
+
+    if 'pesquisa_pagina' not in st.session_state:
+        reiniciar_pesquisa()
+
+    termo_pesquisa = st.text_input("🔎 Pesquisar chamados em todos os municípios:", key='pesquisa_chamados',
+                                   on_change=reiniciar_pesquisa,
+                                   placeholder="Relato, solução, tipo de problema, solicitante ou património")
+    if termo_pesquisa.strip():
+        pagina_pesquisa = st.session_state.pesquisa_pagina
+        resultados, total_resultados = pesquisar_chamados(termo_pesquisa, pagina_pesquisa,
+                                                          geracao=geracoes[GERACAO_CHAMADOS])
+        with st.expander(f"🔎 {total_resultados} Chamados Encontrados", expanded=True):
+            if resultados.empty:
+                st.info("Nenhum chamado corresponde à pesquisa.")
+            for index, row in resultados.iterrows():
+                mostrar_linha_chamado(row, prefixo_chave='pesquisa_edit_btn')
+
+            total_paginas = max(1, -(-total_resultados // TAMANHOS_PAGINA[0]))
+            col_anterior, col_pagina, col_seguinte = st.columns([1, 2, 1])
+            with col_anterior:
+                if st.button("⬅️ Anteriores", key='pesquisa_anterior', disabled=pagina_pesquisa == 0,
+                             use_container_width=True):
+                    st.session_state.pesquisa_pagina -= 1
+                    st.rerun()
+            with col_pagina:
+                st.caption(f"Página {pagina_pesquisa + 1} de {total_paginas}")
+            with col_seguinte:
+                if st.button("Seguintes ➡️", key='pesquisa_seguinte', disabled=pagina_pesquisa + 1 >= total_paginas,
+                             use_container_width=True):
+                    st.session_state.pesquisa_pagina += 1
+                    st.rerun()
+
+    if catalogo_municipios is not None:
+        municipio_col_name, lista_municipios = catalogo_municipios
 
         if not municipio_col_name:
             st.error(
@@ -347,58 +738,165 @@ else:
                 if key not in st.session_state:
                     st.session_state[key] = ""
 
+            instrumentacao.seccao("barra_lateral")
             st.sidebar.header("1. Filtro de Busca")
 
 
+            def reiniciar_paginacao():
+                # Pilha com o cursor (ID de início) de cada página visitada; None = primeira página
+                st.session_state.chamados_cursores = [None]
+
+
             def on_municipio_change():
                 if 'equipamento_selecionado_index' in st.session_state:
                     st.session_state.equipamento_selecionado_index = "Selecione..."
+                reiniciar_paginacao()
+
+
+            def pagina_seguinte(ultimo_id):
+                st.session_state.chamados_cursores.append(ultimo_id)
+
+
+            def pagina_anterior():
+                if len(st.session_state.chamados_cursores) > 1:
+                    st.session_state.chamados_cursores.pop()
+
+
+            if 'chamados_cursores' not in st.session_state:
+                reiniciar_paginacao()
 
 
-            lista_municipios = ["Selecione..."] + sorted(df_equipamentos[municipio_col_name].unique())
             st.sidebar.selectbox(
                 "Município:",
                 options=lista_municipios,
                 on_change=on_municipio_change,
                 key='municipio_selecionado_key'
             )
+            if CARREGAMENTO_EQUIPAMENTOS == 'completo':
+                st.sidebar.caption(f"Equipamentos em memória (partilhados): {memoria_equipamentos_mb():.1f} MB")
+
+            st.sidebar.header("Acesso Direto")
+            termo_equipamento = st.sidebar.text_input("IMEI ou Património:", key='busca_equipamento',
+                                                      placeholder="Identificador completo ou início")
+
+            # --- ACESSO DIRETO A UM EQUIPAMENTO (SEM CARREGAR O MUNICÍPIO) ---
+            if termo_equipamento.strip():
+                instrumentacao.seccao("acesso_direto")
+                st.header("📱 Acesso Direto ao Equipamento")
+                rowids = indice_identificadores(geracoes[GERACAO_EQUIPAMENTOS]).get(termo_equipamento.strip(), [])
+                equipamento = None
+                if len(rowids) == 1:
+                    # Identificador completo e único: leitura pontual, sem construir um DataFrame
+                    equipamento = carregar_equipamento(rowids[0], geracoes[GERACAO_EQUIPAMENTOS])
+                else:
+                    encontrados = procurar_equipamentos(termo_equipamento, geracoes[GERACAO_EQUIPAMENTOS])
+                    if len(encontrados) == 1:
+                        equipamento = Equipamento.de_linha(encontrados.iloc[0], municipio_col_name)
+                    elif not encontrados.empty:
+                        indice_direto = st.selectbox(
+                            f"{len(encontrados)} equipamentos encontrados:",
+                            options=list(encontrados.index),
+                            format_func=lambda index: f"{encontrados.loc[index, municipio_col_name]} | "
+                                                      f"{descrever_equipamento(encontrados.loc[index])}",
+                            key='equipamento_direto_index'
+                        )
+                        equipamento = Equipamento.de_linha(encontrados.loc[indice_direto], municipio_col_name)
+
+                if equipamento is None:
+                    st.warning("Nenhum equipamento encontrado com este IMEI ou Património.")
+                else:
+                    chamados_abertos = carregar_chamados_abertos_equipamento(
+                        equipamento.chave, geracoes[GERACAO_CHAMADOS]
+                    )
+                    with st.expander(f"📖 {len(chamados_abertos)} Chamados em Aberto para este Equipamento",
+                                     expanded=not chamados_abertos.empty):
+                        for index, row in chamados_abertos.iterrows():
+                            mostrar_linha_chamado(row, prefixo_chave='equip_edit_btn')
+
+                    mostrar_formulario_novo_chamado(equipamento)
 
-            if st.session_state.get(
+            elif st.session_state.get(
                     'municipio_selecionado_key') and st.session_state.municipio_selecionado_key != "Selecione...":
                 municipio_selecionado = st.session_state.municipio_selecionado_key
                 st.header(f"📍 Registos em: {municipio_selecionado}")
 
-                # --- SECÇÃO DE CHAMADOS EXISTENTES (COM BOTÃO EM CADA LINHA) ---
-                chamados_existentes = carregar_chamados_por_municipio(municipio_selecionado)
-                if not chamados_existentes.empty:
-                    with st.expander(f"📖 Ver e Gerir {len(chamados_existentes)} Chamados", expanded=True):
+                # --- SECÇÃO DE CHAMADOS EXISTENTES (PAGINADA, COM BOTÃO EM CADA LINHA) ---
+                instrumentacao.seccao("lista_chamados")
+                # A caixa 'incluir_arquivo' está dentro do expander, mas o seu valor já conta para o total
+                incluir_arquivo = st.session_state.get('incluir_arquivo', False)
+                total_chamados = contar_chamados(municipio_selecionado, incluir_arquivo, geracoes[GERACAO_CHAMADOS])
+                if total_chamados:
+                    with st.expander(f"📖 Ver e Gerir {total_chamados} Chamados", expanded=True):
+                        col_status, col_tipo, col_tamanho = st.columns([2, 2, 1])
+                        with col_status:
+                            filtro_status = st.selectbox("Status:", ["Todos"] + STATUS_CHAMADO,
+                                                         key='filtro_status', on_change=reiniciar_paginacao)
+                        with col_tipo:
+                            filtro_tipo = st.selectbox("Tipo de Problema:", ["Todos"] + TIPOS_PROBLEMA,
+                                                       key='filtro_tipo', on_change=reiniciar_paginacao)
+                        with col_tamanho:
+                            tamanho_pagina = st.selectbox("Por página:", TAMANHOS_PAGINA,
+                                                          key='tamanho_pagina', on_change=reiniciar_paginacao)
+                        col_periodo, col_arquivo = st.columns([2, 3])
+                        with col_periodo:
+                            # Vazio = sem filtro; só conta quando os dois dias estão escolhidos
+                            filtro_periodo = st.date_input("Abertos entre:", (), key='filtro_periodo',
+                                                           on_change=reiniciar_paginacao)
+                        with col_arquivo:
+                            st.checkbox(f"Incluir o arquivo (encerrados há mais de "
+                                        f"{arquivamento.DIAS_RETENCAO} dias)",
+                                        key='incluir_arquivo', on_change=reiniciar_paginacao)
+                        desde, ate = filtro_periodo if len(filtro_periodo) == 2 else (None, None)
+
+                        # Pede mais um registo do que o tamanho da página para saber se há página seguinte
+                        cursores = st.session_state.chamados_cursores
+                        try:
+                            chamados_existentes = carregar_chamados_por_municipio(
+                                municipio_selecionado,
+                                status=None if filtro_status == "Todos" else filtro_status,
+                                tipo_problema=None if filtro_tipo == "Todos" else filtro_tipo,
+                                antes_de_id=cursores[-1],
+                                limite=tamanho_pagina + 1,
+                                incluir_arquivo=incluir_arquivo,
+                                desde=desde,
+                                ate=ate,
+                                geracao=geracoes[GERACAO_CHAMADOS]
+                            )
+                        except Exception as e:
+                            import pandas as pd
+
+                            st.warning(f"Não foi possível carregar os chamados existentes: {e}")
+                            chamados_existentes = pd.DataFrame()
+                        tem_pagina_seguinte = len(chamados_existentes) > tamanho_pagina
+                        chamados_existentes = chamados_existentes.iloc[:tamanho_pagina]
+
+                        if chamados_existentes.empty:
+                            st.info("Nenhum chamado corresponde aos filtros selecionados.")
+
                         for index, row in chamados_existentes.iterrows():
-                            col1, col2, col3, col4 = st.columns([1, 2, 3, 1])
-                            with col1:
-                                st.markdown(f"**ID:** {row['ID']}<br>**Data:** {row['Data'].split(' ')[0]}",
-                                            unsafe_allow_html=True)
-                            with col2:
-                                st.markdown(f"**Património:** {row['Património']}<br>**Status:** {row['Status']}",
-                                            unsafe_allow_html=True)
-                            with col3:
-                                st.markdown(f"**Problema:** {row['Problema']}<br>**Relato:** {row['Relato'][:40]}...",
-                                            unsafe_allow_html=True)
-                            with col4:
-                                if st.button("Editar", key=f"edit_btn_{row['ID']}", use_container_width=True):
-                                    st.session_state.editing_chamado_id = row['ID']
-                                    st.rerun()
-                            st.markdown("---")
-
-                dados_filtrados = df_equipamentos[df_equipamentos[municipio_col_name] == municipio_selecionado].copy()
+                            mostrar_linha_chamado(row)
+
+                        col_anterior, col_pagina, col_seguinte = st.columns([1, 2, 1])
+                        with col_anterior:
+                            st.button("⬅️ Anteriores", on_click=pagina_anterior, disabled=len(cursores) == 1,
+                                      use_container_width=True)
+                        with col_pagina:
+                            st.caption(f"Página {len(cursores)}")
+                        with col_seguinte:
+                            st.button("Seguintes ➡️", on_click=pagina_seguinte,
+                                      args=(int(chamados_existentes['ID'].iloc[-1]) if tem_pagina_seguinte else None,),
+                                      disabled=not tem_pagina_seguinte, use_container_width=True)
+
+                instrumentacao.seccao("equipamentos_municipio")
+                dados_filtrados = equipamentos_do_municipio(municipio_selecionado, municipio_col_name)
 
                 if not dados_filtrados.empty:
                     st.header("➕ Abrir Novo Chamado")
                     st.subheader("2. Selecione o Equipamento")
 
-                    equipamento_map = {
-                        index: f"Património: {row.get('Patrimonio', 'N/A')} | Modelo: {row.get('Marca', '')} {row.get('Modelo', '')} | Local: {row.get('Local de Uso', '')}"
-                        for index, row in dados_filtrados.iterrows()
-                    }
+                    # Descrições calculadas uma vez por município e geração, não a cada rerun
+                    equipamento_map = descricoes_equipamentos(municipio_selecionado, municipio_col_name,
+                                                              geracoes[GERACAO_EQUIPAMENTOS])
 
                     opcoes_indices = ["Selecione..."] + list(equipamento_map.keys())
 
@@ -418,56 +916,20 @@ else:
                     indice_selecionado = st.session_state.get('equipamento_selecionado_index')
                     if indice_selecionado is not None and indice_selecionado != "Selecione...":
 
-                        dados_equip_final = dados_filtrados.loc[indice_selecionado]
-
-                        st.markdown('<div class="card">', unsafe_allow_html=True)
-                        st.subheader("3. Preencha os Dados do Novo Chamado")
-
-                        st.markdown("**Detalhes do Equipamento Selecionado:**")
-                        detalhes_html = "<div class='details-grid'>"
-                        for label, value in dados_equip_final.to_dict().items():
-                            detalhes_html += f"<div class='item'><span class='label'>{label}</span> <span class='value'>{value}</span></div>"
-                        detalhes_html += "</div>"
-                        st.markdown(detalhes_html, unsafe_allow_html=True)
+                        equipamento = Equipamento.de_linha(dados_filtrados.loc[indice_selecionado],
+                                                           municipio_col_name)
 
-                        st.markdown("**Informações do Solicitante e do Problema:**")
+                        mostrar_formulario_novo_chamado(equipamento)
 
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.text_input("Nome do Solicitante:", key="form_nome")
-                            st.text_input("Telefone de Contacto:", key="form_telefone")
-                            st.selectbox(
-                                "Tipo de Problema:",
-                                ["", "Ajuda aplicativo", "Suporte técnico", "Roubo", "Outros"],
-                                key="form_tipo_problema"
-                            )
-                        with col2:
-                            st.text_area("Breve relato do problema:", height=155, key="form_relato")
-
-                        if st.button("✔️ Registar Chamado", use_container_width=True):
-                            nome = st.session_state.form_nome
-                            telefone = st.session_state.form_telefone
-                            tipo_problema = st.session_state.form_tipo_problema
-                            relato = st.session_state.form_relato
-
-                            if nome and telefone and tipo_problema and relato:
-                                dados_formulario = {
-                                    "nome": nome,
-                                    "telefone": telefone,
-                                    "tipo_problema": tipo_problema,
-                                    "relato": relato
-                                }
-                                patrimonio_str = str(dados_equip_final.get('Patrimonio', 'N/A'))
-                                save_chamado(dados_equip_final, dados_formulario, municipio_col_name)
-
-                                st.session_state.success_message = f"Chamado para o equipamento de património **{patrimonio_str}** registado com sucesso!"
-                                st.session_state.form_submitted = True
-                                st.rerun()
-                            else:
-                                st.warning("⚠️ Por favor, preencha todos os campos do formulário.", icon="❗")
-
-                        st.markdown('</div>', unsafe_allow_html=True)
+                    mostrar_registo_em_lote(municipio_col_name, dados_filtrados, equipamento_map)
                 else:
                     st.warning("Nenhum equipamento encontrado para este município.")
             else:
                 st.info("⬅️ Comece por selecionar um município na barra lateral para visualizar os equipamentos.")
+                mostrar_registo_em_lote(municipio_col_name)
+
+# --- DESEMPENHO (SÓ ADMINISTRAÇÃO) ---
+# Reruns interrompidos por st.rerun() não chegam aqui e não ficam no log
+resumo_desempenho = instrumentacao.terminar_medicao()
+if TOKEN_ADMIN and hmac.compare_digest(st.query_params.get('admin', ''), TOKEN_ADMIN):
+    mostrar_painel_desempenho(resumo_desempenho)
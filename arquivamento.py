@@ -0,0 +1,80 @@
+# arquivamento.py
+# Retenção dos chamados: os encerrados há mais de DIAS_RETENCAO dias saem da
+# tabela 'chamados' para 'chamados_arquivo', em lotes pequenos, para que as
+# listagens e os índices da tabela principal dependam só dos chamados em
+# curso. Os arquivados continuam nos detalhes, na pesquisa, na exportação e
+# nas estatísticas. Corre numa thread da aplicação ou pela linha de comandos.
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import repositorio
+from repositorio import TAMANHO_BLOCO_IN, arquivar_chamados_encerrados
+
+# --- CONFIGURAÇÕES ---
+# Idade mínima de um chamado encerrado para ser arquivado, contada desde o encerramento
+# (ou desde a abertura, nos chamados encerrados antes de se registar esse momento)
+DIAS_RETENCAO = int(os.environ.get('SUPORTE_DIAS_RETENCAO', '180'))
+# Chamados movidos por transação, e pausa entre transações para dar vez às outras escritas
+TAMANHO_LOTE_ARQUIVO = TAMANHO_BLOCO_IN
+PAUSA_ENTRE_LOTES_S = 0.05
+# Intervalo entre arquivamentos na aplicação (a primeira passagem é logo no arranque)
+INTERVALO_ARQUIVAMENTO_S = 6 * 60 * 60
+
+_logger = logging.getLogger('suporte.arquivamento')
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def arquivar_chamados(dias_retencao=DIAS_RETENCAO, tamanho_lote=TAMANHO_LOTE_ARQUIVO, pausa=PAUSA_ENTRE_LOTES_S):
+    """
+    Arquiva, lote a lote, todos os chamados encerrados há mais de
+    'dias_retencao' dias (pela data de abertura quando a de encerramento não
+    é conhecida). Devolve o número de chamados arquivados.
+    """
+    limite = (date.today() - timedelta(days=dias_retencao)).isoformat()
+    total = 0
+    while True:
+        arquivados = arquivar_chamados_encerrados(limite, tamanho_lote)
+        total += arquivados
+        if arquivados < tamanho_lote:
+            return total
+        time.sleep(pausa)
+
+
+def _arquivar_periodicamente(intervalo):
+    while True:
+        try:
+            arquivar_chamados()
+        except Exception:
+            # Um arquivamento falhado não pode parar a thread; tenta de novo no próximo intervalo
+            _logger.exception("Erro no arquivamento de chamados")
+        time.sleep(intervalo)
+
+
+def iniciar_arquivamento_periodico(intervalo=INTERVALO_ARQUIVAMENTO_S):
+    """Inicia (uma só vez por processo) a thread que arquiva os chamados a cada 'intervalo' segundos."""
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_arquivar_periodicamente, args=(intervalo,),
+                                       name='arquivamento-chamados', daemon=True)
+            _thread.start()
+        return _thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquiva os chamados encerrados antigos.")
+    parser.add_argument('--dias', type=int, default=DIAS_RETENCAO,
+                        help="idade mínima, em dias desde o encerramento (ou a abertura, se este não "
+                             "for conhecido), dos chamados encerrados a arquivar")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_ARQUIVO, help="chamados movidos por transação")
+    parser.add_argument('--db', default=repositorio.DB_FILE_PATH, help="base de dados de chamados")
+    args = parser.parse_args()
+
+    repositorio.configurar_base_dados(args.db)
+    repositorio.inicializar_base_dados()
+    print(f"{arquivar_chamados(args.dias, args.lote)} chamados arquivados.")
@@ -0,0 +1,305 @@
+# base_dados.py
+import atexit
+import functools
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÕES ---
+DB_FILE_PATH = 'chamados.db'
+# Número máximo de conexões abertas em simultâneo pelo processo
+TAMANHO_POOL = 4
+# Tempo (ms) que o SQLite espera por um bloqueio antes de devolver 'database is locked'
+BUSY_TIMEOUT_MS = 5000
+# Número de instruções preparadas mantidas em cache por conexão
+CACHE_INSTRUCOES = 256
+# Política de novas tentativas para escritas bloqueadas
+TENTATIVAS_ESCRITA = 5
+ESPERA_INICIAL_S = 0.05
+# Escritor dedicado: pedidos em espera (acima disto quem escreve espera por vaga),
+# pedidos por transação e tempo máximo de espera pelo resultado de uma escrita
+TAMANHO_FILA_ESCRITA = 1000
+MAX_ESCRITAS_POR_TRANSACAO = 200
+ESPERA_ESCRITA_S = 30
+# Chaves dos contadores de geração na tabela 'metadados'
+GERACAO_EQUIPAMENTOS = 'geracao_equipamentos'
+GERACAO_CHAMADOS = 'geracao_chamados'
+
+
+def abrir_conexao(caminho=DB_FILE_PATH):
+    """
+    Abre uma conexão SQLite já configurada para uso concorrente:
+    modo WAL (leitores não bloqueiam o escritor), synchronous=NORMAL
+    e um busy timeout para esperar por bloqueios em vez de falhar logo.
+    """
+    conn = sqlite3.connect(
+        caminho,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=CACHE_INSTRUCOES,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class PoolConexoes:
+    """
+    Pool simples de conexões SQLite partilhado por todas as sessões do processo.
+    As conexões são criadas a pedido até ao limite 'tamanho' e reutilizadas
+    depois, o que mantém em cache as instruções preparadas de cada uma.
+    """
+
+    def __init__(self, caminho=DB_FILE_PATH, tamanho=TAMANHO_POOL, ao_abrir=None):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        # Chamada com (conexão, caminho) sempre que o pool abre uma conexão nova
+        self.ao_abrir = ao_abrir
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    def _obter(self):
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._criadas < self.tamanho:
+                self._criadas += 1
+                try:
+                    conn = abrir_conexao(self.caminho)
+                    if self.ao_abrir is not None:
+                        self.ao_abrir(conn, self.caminho)
+                    return conn
+                except sqlite3.Error:
+                    self._criadas -= 1
+                    raise
+
+        # Pool esgotado: espera que outra sessão devolva uma conexão
+        try:
+            return self._livres.get(timeout=BUSY_TIMEOUT_MS / 1000)
+        except queue.Empty:
+            raise TimeoutError(f"Nenhuma conexão à base de dados ficou livre em {BUSY_TIMEOUT_MS / 1000:g} s "
+                               f"({self.tamanho} em uso); tente novamente.") from None
+
+    def _devolver(self, conn):
+        # Nunca devolve ao pool uma conexão com uma transação pendente
+        if conn.in_transaction:
+            conn.rollback()
+        self._livres.put(conn)
+
+    @contextmanager
+    def conexao(self):
+        conn = self._obter()
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._devolver(conn)
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._criadas = 0
+
+
+def incrementar_geracao(conn, chave):
+    """
+    Incrementa um contador de geração. Deve ser chamada dentro da mesma
+    transação da escrita que invalida os dados, antes do commit.
+    """
+    conn.execute("UPDATE metadados SET valor = valor + 1 WHERE chave = ?", (chave,))
+
+
+def ler_geracoes(conn):
+    # Uma única consulta barata, feita a cada rerun da aplicação
+    return dict(conn.execute("SELECT chave, valor FROM metadados"))
+
+
+class EscritorDedicado:
+    """
+    Uma única thread que faz todas as escritas do processo. Os pedidos ficam
+    numa fila limitada e a thread junta os que encontra em espera numa só
+    transação (group commit): num pico de registos paga-se um commit por
+    lote em vez de um por chamado, sem disputar o bloqueio de escrita do
+    SQLite entre sessões. Cada pedido corre num SAVEPOINT próprio, pelo que
+    o erro de um pedido não desfaz os outros do mesmo lote.
+    """
+
+    def __init__(self, caminho=DB_FILE_PATH, tamanho_fila=TAMANHO_FILA_ESCRITA,
+                 max_lote=MAX_ESCRITAS_POR_TRANSACAO, ao_abrir=None):
+        self.caminho = caminho
+        self.max_lote = max_lote
+        self.ao_abrir = ao_abrir
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._thread = None
+        self._fechar_registado = False
+        self._lock = threading.Lock()
+
+    def submeter(self, funcao, *args):
+        """
+        Põe na fila a escrita funcao(conn, *args) e devolve um Future com o
+        seu resultado. A função não abre nem termina transações.
+        """
+        self._garantir_thread()
+        futuro = Future()
+        try:
+            self._fila.put((futuro, funcao, args), timeout=ESPERA_ESCRITA_S)
+        except queue.Full:
+            raise TimeoutError("A fila de escritas está cheia; tente novamente.") from None
+        # Se a thread morreu entre a verificação e o put, o pedido não pode ficar esquecido na fila
+        self._garantir_thread()
+        return futuro
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='escritor-sqlite', daemon=True)
+                self._thread.start()
+                if not self._fechar_registado:
+                    # À saída do processo, grava o que estiver na fila e fecha a conexão
+                    atexit.register(self.fechar)
+                    self._fechar_registado = True
+
+    def executar(self, funcao, *args):
+        # Escrita síncrona: só devolve depois do commit do lote em que entrou
+        futuro = self.submeter(funcao, *args)
+        try:
+            return futuro.result(timeout=ESPERA_ESCRITA_S)
+        except TimeoutError:
+            # Ainda na fila: é retirada, para não ser gravada depois de quem chamou já ter desistido
+            if futuro.cancel():
+                raise TimeoutError("A escrita não foi feita: o escritor não respondeu a tempo; tente novamente.") from None
+        # Já está a ser gravada: espera pelo commit (limitado pelo busy timeout) em vez de a abandonar
+        try:
+            return futuro.result(timeout=ESPERA_ESCRITA_S)
+        except TimeoutError:
+            raise TimeoutError("Não foi possível confirmar se a escrita foi gravada; "
+                               "verifique antes de tentar novamente.") from None
+
+    def _executar(self):
+        conn = None
+        lote = []
+        try:
+            conn = abrir_conexao(self.caminho)
+            if self.ao_abrir is not None:
+                self.ao_abrir(conn, self.caminho)
+            while True:
+                pedido = self._fila.get()
+                if pedido is None:
+                    return
+                lote = [pedido]
+                # Junta ao lote o que chegou entretanto, sem esperar por mais
+                while len(lote) < self.max_lote:
+                    try:
+                        pedido = self._fila.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pedido is None:
+                        self._fila.put(None)
+                        break
+                    lote.append(pedido)
+                self._executar_lote(conn, lote)
+                lote = []
+        except Exception as e:
+            self._falhar_pendentes(lote, e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _falhar_pendentes(self, lote, erro):
+        # A thread vai terminar (ex.: não conseguiu abrir a base de dados): os pedidos
+        # em curso e em fila recebem o erro e o próximo submeter() arranca outra thread.
+        with self._lock:
+            if self._thread is threading.current_thread():
+                self._thread = None
+            while True:
+                try:
+                    pedido = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if pedido is not None:
+                    lote.append(pedido)
+        for futuro, _, _ in lote:
+            if not futuro.done():
+                futuro.set_exception(erro)
+
+    def _executar_lote(self, conn, lote):
+        resultados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for futuro, funcao, args in lote:
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT pedido")
+                try:
+                    resultados.append((futuro, funcao(conn, *args), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO pedido")
+                    resultados.append((futuro, None, e))
+                conn.execute("RELEASE pedido")
+            conn.commit()
+        except Exception as e:
+            # BEGIN ou COMMIT falhou (ex.: base bloqueada por outro processo): nada do lote ficou gravado
+            if conn.in_transaction:
+                conn.rollback()
+            for futuro, _, _ in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        for futuro, resultado, erro in resultados:
+            if erro is None:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(erro)
+
+    def fechar(self):
+        # Termina a thread depois de escrever o que já está na fila
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._fila.put(None)
+            thread.join()
+
+
+def _base_bloqueada(erro):
+    mensagem = str(erro).lower()
+    return 'database is locked' in mensagem or 'database is busy' in mensagem
+
+
+def com_retentativa(funcao=None, *, tentativas=TENTATIVAS_ESCRITA, espera_inicial=ESPERA_INICIAL_S):
+    """
+    Decorador para funções de escrita: volta a executar a função quando o
+    SQLite devolve 'database is locked', com espera exponencial e jitter.
+    A função decorada tem de abrir e terminar a sua própria transação.
+    """
+    if funcao is None:
+        return functools.partial(com_retentativa, tentativas=tentativas, espera_inicial=espera_inicial)
+
+    @functools.wraps(funcao)
+    def wrapper(*args, **kwargs):
+        espera = espera_inicial
+        for tentativa in range(1, tentativas + 1):
+            try:
+                return funcao(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not _base_bloqueada(e) or tentativa == tentativas:
+                    raise
+                time.sleep(espera + random.uniform(0, espera))
+                espera *= 2
+
+    return wrapper
@@ -0,0 +1,350 @@
+# benchmark.py
+# Gera dados sintéticos à escala do estado (com semente fixa, reprodutíveis),
+# mede os caminhos principais de leitura e escrita e grava os resultados em JSON.
+#
+# Exemplos:
+#   python benchmark.py                                  # 400 municípios, 100k equipamentos, 1M chamados
+#   python benchmark.py --dispositivos 20000 --chamados 100000 --saida antes.json
+#   python benchmark.py --saida depois.json --comparar antes.json
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import importar_dados
+import repositorio
+from base_dados import abrir_conexao
+from migracoes import aplicar_migracoes
+from repositorio import STATUS_CHAMADO, TIPOS_PROBLEMA, Equipamento
+
+# --- CONFIGURAÇÕES ---
+SEMENTE = 42
+MUNICIPIOS = 400
+DISPOSITIVOS = 100_000
+CHAMADOS = 1_000_000
+# Número de execuções de cada cenário de leitura/escrita pontual
+REPETICOES = 200
+# Escritores simultâneos e escritas por escritor no cenário concorrente
+ESCRITORES = 4
+ESCRITAS_POR_ESCRITOR = 100
+# Chamados inseridos por transação ao gerar os dados
+LOTE_GERACAO = 50_000
+# Dias de histórico pelos quais os chamados gerados são distribuídos
+DIAS_HISTORICO = 730
+FICHEIRO_RESULTADOS = 'benchmark_resultados.json'
+
+MARCAS_MODELOS = {
+    'Samsung': ['Galaxy A14', 'Galaxy A34', 'Galaxy A54', 'Galaxy Tab A8'],
+    'Motorola': ['Moto G54', 'Moto G84', 'Moto E13'],
+    'Apple': ['iPhone 13', 'iPhone 15 Pro'],
+    'Positivo': ['Twist 5', 'Tab Q10'],
+}
+CAPACIDADES = ['32GB', '64GB', '128GB', '256GB']
+SITUACOES = ['Em uso', 'Em uso', 'Em uso', 'Em estoque', 'Danificado', 'Roubado']
+PALAVRAS_RELATO = ['ecrã', 'bateria', 'aplicativo', 'senha', 'rede', 'câmara', 'carregador', 'lento', 'travado',
+                   'partido', 'wifi', 'atualização', 'som', 'microfone', 'chip', 'roubado', 'escola', 'aluno']
+COLUNAS_CSV = ['Município', 'IMEI1', 'IMEI2', 'Marca', 'Modelo', 'Capacidade', 'Entrega', 'Local de Uso', 'Situação',
+               'Patrimonio']
+
+
+# --- GERADOR DE DADOS ---
+
+def gerar_equipamentos(rng, municipios, total):
+    """
+    Devolve 'total' linhas de equipamentos (dicionários com as colunas do CSV),
+    distribuídas pelos municípios com alguns muito maiores do que outros.
+    Cerca de 5% não têm património, para exercitar a chave pelo IMEI1.
+    """
+    # Pesos de Zipf: poucos municípios grandes, muitos pequenos
+    pesos = [1 / (posicao + 1) for posicao in range(len(municipios))]
+    escolhidos = rng.choices(municipios, weights=pesos, k=total)
+    patrimonios = rng.sample(range(10 ** 10, 10 ** 11), total)
+    equipamentos = []
+    for indice, municipio in enumerate(escolhidos):
+        marca = rng.choice(list(MARCAS_MODELOS))
+        equipamentos.append({
+            'Município': municipio,
+            'IMEI1': str(350000000000000 + indice * 7 + rng.randrange(7)),
+            'IMEI2': str(860000000000000 + indice * 7 + rng.randrange(7)),
+            'Marca': marca,
+            'Modelo': rng.choice(MARCAS_MODELOS[marca]),
+            'Capacidade': rng.choice(CAPACIDADES),
+            'Entrega': municipio,
+            'Local de Uso': f"Escola do município {municipio}",
+            'Situação': rng.choice(SITUACOES),
+            'Patrimonio': '' if rng.random() < 0.05 else str(patrimonios[indice]),
+        })
+    return equipamentos
+
+
+def escrever_csv(caminho, equipamentos):
+    with open(caminho, 'w', newline='', encoding='utf-8') as ficheiro:
+        escritor = csv.DictWriter(ficheiro, fieldnames=COLUNAS_CSV, delimiter=';')
+        escritor.writeheader()
+        escritor.writerows(equipamentos)
+
+
+def _relato(rng):
+    return ' '.join(rng.choices(PALAVRAS_RELATO, k=rng.randint(4, 12)))
+
+
+def gerar_chamados(rng, caminho_db, equipamentos, total):
+    """
+    Insere 'total' chamados de equipamentos escolhidos ao acaso, com datas
+    espalhadas por DIAS_HISTORICO dias, pelas mesmas instruções SQL da
+    aplicação (os triggers de pesquisa e estatísticas correm normalmente).
+    """
+    inicio = datetime.now() - timedelta(days=DIAS_HISTORICO)
+    conn = abrir_conexao(caminho_db)
+    try:
+        for base in range(0, total, LOTE_GERACAO):
+            registos = []
+            for _ in range(min(LOTE_GERACAO, total - base)):
+                equipamento = Equipamento.de_linha(rng.choice(equipamentos), 'Município')
+                momento = inicio + timedelta(seconds=rng.randrange(DIAS_HISTORICO * 86400))
+                linha = list(repositorio._linha_chamado(equipamento, {
+                    "nome": f"Solicitante {rng.randrange(100000)}",
+                    "telefone": f"41 9{rng.randrange(10 ** 8):08d}",
+                    "tipo_problema": rng.choice(TIPOS_PROBLEMA),
+                    "relato": _relato(rng),
+                }, momento))
+                # Histórico realista: a maioria dos chamados antigos já está encerrada
+                linha[-2] = rng.choices(STATUS_CHAMADO, weights=[2, 1, 7])[0]
+                registos.append((equipamento, linha))
+            registos.sort(key=lambda registo: registo[1][0])
+
+            conn.execute("BEGIN")
+            conn.executemany(repositorio.SQL_GUARDAR_DISPOSITIVO,
+                             {e.chave: repositorio._linha_dispositivo(e) for e, _ in registos}.values())
+            conn.executemany(repositorio.SQL_INSERIR_CHAMADO, [linha for _, linha in registos])
+            conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+# --- MEDIÇÃO ---
+
+def _resumo(tempos, **extra):
+    # Estatísticas de uma lista de durações em segundos
+    ordenados = sorted(tempos)
+    resumo = {
+        'n': len(ordenados),
+        'total_s': round(sum(ordenados), 4),
+        'media_ms': round(statistics.fmean(ordenados) * 1000, 3),
+        'p50_ms': round(ordenados[len(ordenados) // 2] * 1000, 3),
+        'p95_ms': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))] * 1000, 3),
+        'max_ms': round(ordenados[-1] * 1000, 3),
+    }
+    resumo.update(extra)
+    return resumo
+
+
+def medir(funcao, argumentos):
+    # Executa 'funcao' uma vez por tuplo de 'argumentos' e mede cada execução
+    tempos = []
+    for args in argumentos:
+        inicio = time.perf_counter()
+        funcao(*args)
+        tempos.append(time.perf_counter() - inicio)
+    return _resumo(tempos)
+
+
+def medir_escrita_concorrente(equipamentos, escritores, escritas):
+    """
+    'escritores' threads a gravar 'escritas' chamados cada uma ao mesmo tempo,
+    pelo escritor dedicado (como as sessões do Streamlit). Conta também as
+    escritas que falharam mesmo depois das novas tentativas.
+    """
+    tempos = []
+    falhas = []
+    lock = threading.Lock()
+    barreira = threading.Barrier(escritores)
+
+    def escritor(semente):
+        rng = random.Random(semente)
+        barreira.wait()
+        for _ in range(escritas):
+            equipamento = Equipamento.de_linha(rng.choice(equipamentos), 'Município')
+            inicio = time.perf_counter()
+            try:
+                repositorio.save_chamado(equipamento, {"nome": "Benchmark", "telefone": "0", "tipo_problema": "Outros",
+                                                       "relato": _relato(rng)})
+            except (sqlite3.Error, TimeoutError) as e:
+                # TimeoutError: fila de escritas cheia ou escritor sem resposta a tempo
+                with lock:
+                    falhas.append(str(e))
+                continue
+            with lock:
+                tempos.append(time.perf_counter() - inicio)
+
+    threads = [threading.Thread(target=escritor, args=(SEMENTE + n,)) for n in range(escritores)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+    return _resumo(tempos or [0.0], escritores=escritores, falhas=len(falhas),
+                   escritas_por_segundo=round(len(tempos) / duracao, 1))
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def executar(args):
+    rng = random.Random(args.semente)
+    resultados = {}
+    pasta = os.path.abspath(args.pasta) if args.pasta else tempfile.mkdtemp(prefix='benchmark_suporte_')
+    os.makedirs(pasta, exist_ok=True)
+    pasta_original = os.getcwd()
+    # importar_dados e o repositório usam caminhos relativos ('chamados.db', 'dados_equipamentos.csv')
+    os.chdir(pasta)
+    try:
+        for caminho in (importar_dados.DB_FILE_PATH, importar_dados.CSV_FILE_PATH):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        caminho_db = os.path.abspath(importar_dados.DB_FILE_PATH)
+
+        print(f"A gerar {args.dispositivos} equipamentos em {args.municipios} municípios...")
+        municipios = [f"Município {numero:03d}" for numero in range(1, args.municipios + 1)]
+        equipamentos = gerar_equipamentos(rng, municipios, args.dispositivos)
+        escrever_csv(importar_dados.CSV_FILE_PATH, equipamentos)
+
+        conn = abrir_conexao(caminho_db)
+        aplicar_migracoes(conn)
+        conn.close()
+
+        print("A medir importar_csv_para_sqlite...")
+        with contextlib.redirect_stdout(io.StringIO()) as saida_importacao:
+            resultados['importar_csv_para_sqlite'] = medir(importar_dados.importar_csv_para_sqlite, [()])
+        if '--- SUCESSO! ---' not in saida_importacao.getvalue():
+            raise RuntimeError(f"A importação falhou:\n{saida_importacao.getvalue()}")
+        resultados['importar_csv_para_sqlite']['linhas'] = args.dispositivos
+
+        print(f"A gerar {args.chamados} chamados...")
+        inicio = time.perf_counter()
+        gerar_chamados(rng, caminho_db, equipamentos, args.chamados)
+        resultados['gerar_chamados'] = _resumo([time.perf_counter() - inicio], linhas=args.chamados)
+
+        repositorio.configurar_base_dados(caminho_db)
+        repositorio.inicializar_base_dados()
+        with repositorio.obter_pool().conexao() as conn:
+            maior_id = conn.execute("SELECT MAX(id) FROM chamados").fetchone()[0] or 1
+        n = args.repeticoes
+
+        print("A medir as leituras...")
+        inicio = time.perf_counter()
+        df_equipamentos = repositorio.carregar_tabela_equipamentos()
+        resultados['carregar_dados_do_db'] = _resumo(
+            [time.perf_counter() - inicio],
+            memoria_mb=round(df_equipamentos.memory_usage(deep=True).sum() / (1024 * 1024), 1))
+        del df_equipamentos
+        resultados['listar_municipios'] = medir(repositorio.listar_municipios, [()] * min(n, 20))
+        resultados['carregar_equipamentos_municipio'] = medir(
+            repositorio.carregar_equipamentos_municipio, [(rng.choice(municipios), 'Município') for _ in range(n)])
+        resultados['carregar_chamados_por_municipio'] = medir(
+            repositorio.carregar_chamados_por_municipio, [(rng.choice(municipios),) for _ in range(n)])
+        resultados['carregar_chamados_por_municipio_filtrado'] = medir(
+            repositorio.carregar_chamados_por_municipio,
+            [(rng.choice(municipios), rng.choice(STATUS_CHAMADO), rng.choice(TIPOS_PROBLEMA)) for _ in range(n)])
+        resultados['carregar_chamados_por_municipio_pagina_funda'] = medir(
+            repositorio.carregar_chamados_por_municipio,
+            [(rng.choice(municipios), None, None, rng.randint(1, maior_id)) for _ in range(n)])
+        resultados['contar_chamados'] = medir(repositorio.contar_chamados, [(rng.choice(municipios),) for _ in range(n)])
+        resultados['carregar_detalhes_chamado'] = medir(
+            repositorio.carregar_detalhes_chamado, [(rng.randint(1, maior_id),) for _ in range(n)])
+        resultados['pesquisar_chamados'] = medir(
+            repositorio.pesquisar_chamados, [(' '.join(rng.sample(PALAVRAS_RELATO, 2)),) for _ in range(n)])
+        resultados['carregar_estatisticas'] = medir(
+            repositorio.carregar_estatisticas, [(['municipio', 'status'],) for _ in range(min(n, 20))])
+        indice = repositorio.construir_indice_identificadores()
+        resultados['procurar_equipamentos'] = medir(
+            repositorio.procurar_equipamentos, [(rng.choice(equipamentos)['IMEI1'], indice) for _ in range(n)])
+        del indice
+
+        print("A medir as escritas...")
+        resultados['save_chamado'] = medir(repositorio.save_chamado, [
+            (Equipamento.de_linha(rng.choice(equipamentos), 'Município'),
+             {"nome": "Benchmark", "telefone": "0", "tipo_problema": "Outros", "relato": _relato(rng)})
+            for _ in range(n)])
+        resultados['update_chamado_details'] = medir(repositorio.update_chamado_details, [
+            (rng.randint(1, maior_id), rng.choice(STATUS_CHAMADO), _relato(rng)) for _ in range(n)])
+        resultados['save_chamado_concorrente'] = medir_escrita_concorrente(equipamentos, args.escritores,
+                                                                           args.escritas)
+
+        repositorio.obter_pool().fechar()
+        tamanho_db_mb = round(os.path.getsize(caminho_db) / (1024 * 1024), 1)
+    finally:
+        os.chdir(pasta_original)
+        if not args.pasta:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_atual(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'parametros': {
+            'semente': args.semente, 'municipios': args.municipios, 'dispositivos': args.dispositivos,
+            'chamados': args.chamados, 'repeticoes': args.repeticoes, 'escritores': args.escritores,
+            'escritas': args.escritas,
+        },
+        'tamanho_db_mb': tamanho_db_mb,
+        'cenarios': resultados,
+    }
+
+
+def comparar(atual, anterior):
+    # Razão entre as médias (atual / anterior) de cada cenário presente nos dois ficheiros
+    print(f"\n{'Cenário':48} {'anterior ms':>12} {'atual ms':>12} {'razão':>8}")
+    for nome, resumo in atual['cenarios'].items():
+        antes = anterior.get('cenarios', {}).get(nome)
+        if not antes or not antes['media_ms']:
+            continue
+        razao = resumo['media_ms'] / antes['media_ms']
+        aviso = '  <-- mais lento' if razao > 1.2 else ''
+        print(f"{nome:48} {antes['media_ms']:12.3f} {resumo['media_ms']:12.3f} {razao:8.2f}{aviso}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede o desempenho da aplicação com dados sintéticos.")
+    parser.add_argument('--semente', type=int, default=SEMENTE, help="semente do gerador de dados")
+    parser.add_argument('--municipios', type=int, default=MUNICIPIOS, help="número de municípios")
+    parser.add_argument('--dispositivos', type=int, default=DISPOSITIVOS, help="número de equipamentos")
+    parser.add_argument('--chamados', type=int, default=CHAMADOS, help="número de chamados")
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES, help="execuções de cada cenário")
+    parser.add_argument('--escritores', type=int, default=ESCRITORES, help="escritores simultâneos")
+    parser.add_argument('--escritas', type=int, default=ESCRITAS_POR_ESCRITOR, help="escritas por escritor")
+    parser.add_argument('--pasta', help="pasta onde gerar (e manter) a base de dados; por omissão, uma temporária")
+    parser.add_argument('--saida', default=FICHEIRO_RESULTADOS, help="ficheiro JSON com os resultados")
+    parser.add_argument('--comparar', help="ficheiro JSON de uma execução anterior para comparação")
+    args = parser.parse_args()
+
+    resultados = executar(args)
+    with open(args.saida, 'w', encoding='utf-8') as ficheiro:
+        json.dump(resultados, ficheiro, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em '{args.saida}'.")
+
+    for nome, resumo in resultados['cenarios'].items():
+        print(f"{nome:48} média {resumo['media_ms']:10.3f} ms | p95 {resumo['p95_ms']:10.3f} ms")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as ficheiro:
+            comparar(resultados, json.load(ficheiro))
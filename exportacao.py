@@ -0,0 +1,119 @@
+# exportacao.py
+# Exportação dos chamados para CSV ou Parquet, filtrada por município, estado
+# e período. As linhas passam em blocos do SQLite para o ficheiro, sem nunca
+# carregar o histórico inteiro em memória. Usado pela linha de comandos e
+# pelo botão de download da aplicação.
+import argparse
+import csv
+import io
+import sys
+from datetime import date
+
+import repositorio
+from repositorio import COLUNAS_EXPORTACAO, TAMANHO_BLOCO_EXPORTACAO, iterar_chamados_exportacao
+
+# --- CONFIGURAÇÕES ---
+FORMATOS = ('csv', 'parquet')
+# O mesmo separador dos ficheiros CSV que a aplicação lê; o BOM faz o Excel reconhecer o UTF-8
+SEPARADOR_CSV = ';'
+CODIFICACAO_CSV = 'utf-8-sig'
+
+
+def parquet_disponivel():
+    # O pyarrow é opcional: sem ele só há exportação para CSV
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def escrever_csv(blocos, destino):
+    """
+    Escreve os blocos de chamados em CSV no ficheiro binário 'destino'.
+    Devolve o número de linhas escritas.
+    """
+    texto = io.TextIOWrapper(destino, encoding=CODIFICACAO_CSV, newline='', write_through=True)
+    try:
+        escritor = csv.writer(texto, delimiter=SEPARADOR_CSV)
+        escritor.writerow(COLUNAS_EXPORTACAO)
+        linhas = 0
+        for bloco in blocos:
+            escritor.writerows(bloco)
+            linhas += len(bloco)
+        texto.flush()
+        return linhas
+    finally:
+        # Solta o wrapper sem fechar 'destino', que pertence a quem chamou
+        texto.detach()
+
+
+def escrever_parquet(blocos, destino):
+    """
+    Escreve os blocos de chamados em Parquet no ficheiro binário 'destino',
+    um grupo de linhas por bloco. Devolve o número de linhas escritas.
+    Requer o pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([(coluna, pa.int64() if coluna == 'id' else pa.string()) for coluna in COLUNAS_EXPORTACAO])
+    linhas = 0
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as escritor:
+        for bloco in blocos:
+            colunas = list(zip(*bloco))
+            escritor.write_batch(pa.record_batch([pa.array(valores, type=campo.type)
+                                                  for valores, campo in zip(colunas, esquema)], schema=esquema))
+            linhas += len(bloco)
+        if linhas == 0:
+            # Um ficheiro sem grupos de linhas continua a ter o esquema
+            escritor.write_table(esquema.empty_table())
+    return linhas
+
+
+def exportar_chamados(destino, formato='csv', municipio=None, status=None, desde=None, ate=None,
+                      tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Exporta os chamados que respeitam os filtros para o ficheiro binário
+    'destino' no formato indicado ('csv' ou 'parquet'). Devolve o número de
+    linhas exportadas.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação inválido: {formato}")
+    if formato == 'parquet' and not parquet_disponivel():
+        raise RuntimeError("A exportação para Parquet requer o pacote 'pyarrow' (pip install pyarrow).")
+
+    blocos = iterar_chamados_exportacao(municipio, status, desde, ate, tamanho_bloco)
+    if formato == 'parquet':
+        return escrever_parquet(blocos, destino)
+    return escrever_csv(blocos, destino)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta os chamados para CSV ou Parquet.")
+    parser.add_argument('saida', help="ficheiro a criar, ou '-' para a saída padrão")
+    parser.add_argument('--formato', choices=FORMATOS, help="por omissão, deduzido da extensão da saída")
+    parser.add_argument('--municipio', help="só os chamados deste município")
+    parser.add_argument('--status', choices=repositorio.STATUS_CHAMADO, help="só os chamados neste estado")
+    parser.add_argument('--desde', type=date.fromisoformat, help="só os chamados abertos a partir deste dia (AAAA-MM-DD)")
+    parser.add_argument('--ate', type=date.fromisoformat, help="só os chamados abertos até este dia, inclusive (AAAA-MM-DD)")
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO_EXPORTACAO,
+                        help="linhas lidas da base de dados de cada vez")
+    parser.add_argument('--db', default=repositorio.DB_FILE_PATH, help="base de dados de chamados")
+    args = parser.parse_args()
+
+    formato = args.formato or ('parquet' if args.saida.lower().endswith('.parquet') else 'csv')
+    repositorio.configurar_base_dados(args.db)
+    repositorio.inicializar_base_dados()
+    try:
+        if args.saida == '-':
+            linhas = exportar_chamados(sys.stdout.buffer, formato, args.municipio, args.status,
+                                       args.desde, args.ate, args.bloco)
+        else:
+            with open(args.saida, 'wb') as ficheiro:
+                linhas = exportar_chamados(ficheiro, formato, args.municipio, args.status,
+                                           args.desde, args.ate, args.bloco)
+    except (RuntimeError, ValueError) as e:
+        sys.exit(f"Erro: {e}")
+    # Vai para stderr para não se misturar com os dados quando a saída é '-'
+    print(f"{linhas} chamados exportados ({formato}).", file=sys.stderr)
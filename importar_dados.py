@@ -1,21 +1,59 @@
 # importar_dados.py
+import argparse
 import pandas as pd
-import sqlite3
 import os
 
+from base_dados import GERACAO_EQUIPAMENTOS, abrir_conexao, incrementar_geracao, ler_geracoes
+from migracoes import aplicar_migracoes, criar_indices_equipamentos, expressao_chave_equipamento
+
 # --- CONFIGURAÇÕES ---
 CSV_FILE_PATH = 'dados_equipamentos.csv'
 # Alterado para usar a base de dados de chamados já existente
 DB_FILE_PATH = 'chamados.db'
 # O nome da tabela para guardar os dados dos equipamentos
 TABLE_NAME = 'equipamentos'
+# Tabela com a geração anterior dos equipamentos, mantida para reverter uma importação
+TABELA_ANTERIOR = 'equipamentos_anterior'
+# Número de linhas do CSV lidas de cada vez na importação incremental
+TAMANHO_BLOCO = 50000
+# Número de linhas comparadas por transação ao aplicar as diferenças; cada lote
+# é gravado de seguida, para não prender o bloqueio de escrita durante o ficheiro todo
+TAMANHO_LOTE_DIFERENCAS = 5000
+
+
+def _trocar_tabelas(conn, nova):
+    """
+    Troca a tabela 'equipamentos' pela tabela 'nova' numa única transação.
+    A geração anterior fica guardada em 'equipamentos_anterior' para permitir
+    reverter a importação. Os leitores nunca veem a tabela em falta.
+    """
+    # Com legacy_alter_table as vistas e triggers que referem 'equipamentos'
+    # não são reescritos para seguir a tabela antiga no RENAME.
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (TABLE_NAME,)).fetchone()
+        conn.execute(f"DROP TABLE IF EXISTS {TABELA_ANTERIOR}")
+        if existe:
+            conn.execute(f"ALTER TABLE {TABLE_NAME} RENAME TO {TABELA_ANTERIOR}")
+        conn.execute(f'ALTER TABLE "{nova}" RENAME TO {TABLE_NAME}')
+        # Avisa as aplicações em execução de que os equipamentos mudaram
+        incrementar_geracao(conn, GERACAO_EQUIPAMENTOS)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
 
 
-def importar_csv_para_sqlite():
+def importar_csv_para_sqlite(tamanho_bloco=TAMANHO_BLOCO):
     """
     Lê um ficheiro CSV e importa os seus dados para a tabela 'equipamentos'
     dentro da base de dados 'chamados.db'.
-    A tabela 'equipamentos' existente será substituída se já existir.
+    Os dados são primeiro escritos e indexados numa tabela-sombra, que depois
+    substitui a tabela 'equipamentos' numa única transação; a aplicação pode
+    continuar a ler durante toda a importação.
     """
     # Verifica se o ficheiro CSV existe
     if not os.path.exists(CSV_FILE_PATH):
@@ -24,27 +62,43 @@ def importar_csv_para_sqlite():
         return
 
     try:
-        # Lê os dados do ficheiro CSV para um DataFrame do Pandas
-        print(f"A ler dados de '{CSV_FILE_PATH}'...")
-        df = pd.read_csv(CSV_FILE_PATH, sep=';', dtype=str)
-        df.columns = df.columns.str.strip()
-        print(f"{len(df)} linhas lidas com sucesso.")
-
         # Conecta-se à base de dados SQLite existente
         print(f"A conectar-se à base de dados '{DB_FILE_PATH}'...")
-        conn = sqlite3.connect(DB_FILE_PATH)
+        conn = abrir_conexao(DB_FILE_PATH)
+        aplicar_migracoes(conn)
+
+        # O nome da tabela-sombra inclui a geração seguinte, para que os nomes
+        # dos seus índices nunca colidam com os da tabela em uso.
+        geracao = ler_geracoes(conn)[GERACAO_EQUIPAMENTOS]
+        tabela_sombra = f"{TABLE_NAME}_g{geracao + 1}"
+        conn.execute(f'DROP TABLE IF EXISTS "{tabela_sombra}"')
 
-        # Usa a função to_sql do Pandas para guardar o DataFrame na base de dados
-        # if_exists='replace' irá apagar a tabela antiga e criar uma nova.
-        # Isto é útil para garantir que os dados estão sempre atualizados.
-        print(f"A importar dados para a tabela '{TABLE_NAME}' dentro de '{DB_FILE_PATH}'...")
-        df.to_sql(TABLE_NAME, conn, if_exists='replace', index=False)
+        # Lê o CSV em blocos e grava-os na tabela-sombra com o to_sql do Pandas
+        print(f"A ler dados de '{CSV_FILE_PATH}' para a tabela temporária '{tabela_sombra}'...")
+        lidas = 0
+        for bloco in _ler_blocos_csv(tamanho_bloco):
+            bloco.to_sql(tabela_sombra, conn, if_exists='append', index=False)
+            lidas += len(bloco)
+        if not lidas:
+            conn.execute(f'DROP TABLE IF EXISTS "{tabela_sombra}"')
+            conn.close()
+            print(f"Erro: O ficheiro '{CSV_FILE_PATH}' não tem linhas de dados.")
+            return
+        print(f"{lidas} linhas lidas com sucesso.")
+
+        print("A criar os índices da tabela de equipamentos...")
+        criar_indices_equipamentos(conn, tabela_sombra)
+        conn.commit()
+
+        print(f"A substituir a tabela '{TABLE_NAME}' dentro de '{DB_FILE_PATH}'...")
+        _trocar_tabelas(conn, tabela_sombra)
 
         # Fecha a conexão com a base de dados
         conn.close()
 
         print("\n--- SUCESSO! ---")
         print(f"Os dados foram importados com sucesso para a tabela '{TABLE_NAME}' dentro de '{DB_FILE_PATH}'.")
+        print(f"A versão anterior ficou em '{TABELA_ANTERIOR}' (reverta com 'python importar_dados.py --reverter').")
         print("Agora já pode executar a aplicação principal com 'streamlit run app.py'.")
 
     except Exception as e:
@@ -52,5 +106,197 @@ def importar_csv_para_sqlite():
         print(f"Ocorreu um erro durante a importação: {e}")
 
 
+def reverter_importacao():
+    """
+    Repõe a geração anterior da tabela de equipamentos, trocando-a com a
+    atual (que passa a ser a 'anterior', permitindo desfazer a reversão).
+    """
+    try:
+        conn = abrir_conexao(DB_FILE_PATH)
+        aplicar_migracoes(conn)
+        anterior = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (TABELA_ANTERIOR,)).fetchone()
+        if anterior is None:
+            conn.close()
+            print(f"Erro: Não existe a tabela '{TABELA_ANTERIOR}'; não há importação para reverter.")
+            return
+
+        conn.execute(f"ALTER TABLE {TABELA_ANTERIOR} RENAME TO {TABELA_ANTERIOR}_reposta")
+        conn.commit()
+        _trocar_tabelas(conn, f"{TABELA_ANTERIOR}_reposta")
+        conn.close()
+
+        print("\n--- SUCESSO! ---")
+        print(f"A tabela '{TABLE_NAME}' voltou à versão anterior.")
+
+    except Exception as e:
+        print(f"\n--- ERRO ---")
+        print(f"Ocorreu um erro ao reverter a importação: {e}")
+
+
+def _ler_blocos_csv(tamanho_bloco):
+    for bloco in pd.read_csv(CSV_FILE_PATH, sep=';', dtype=str, chunksize=tamanho_bloco):
+        bloco.columns = bloco.columns.str.strip()
+        yield bloco
+
+
+def _em_lotes(conn, tabela, tamanho_lote):
+    # Intervalos (de, ate] de rowid que cobrem a tabela, com 'tamanho_lote' rowids cada
+    maximo = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {tabela}").fetchone()[0]
+    for de in range(0, maximo, tamanho_lote):
+        yield de, min(de + tamanho_lote, maximo)
+
+
+def _gravar_lote(conn, alteracao, *args):
+    # Aplica um lote na sua própria transação curta e devolve as linhas afetadas
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        afetadas = alteracao(conn, *args)
+        if afetadas:
+            incrementar_geracao(conn, GERACAO_EQUIPAMENTOS)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return afetadas
+
+
+def _remover_ausentes(conn, de, ate):
+    chave_tabela = expressao_chave_equipamento('e.')
+    return conn.execute(f'''
+        DELETE FROM {TABLE_NAME} AS e
+        WHERE e.rowid > ? AND e.rowid <= ?
+          AND {chave_tabela} IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM staging s WHERE s._chave = {chave_tabela})
+    ''', (de, ate)).rowcount
+
+
+def _atualizar_alterados(conn, colunas, de, ate):
+    chave_tabela = expressao_chave_equipamento('e.')
+    atribuicoes = ", ".join(f'"{c}" = s."{c}"' for c in colunas)
+    diferencas = " OR ".join(f'e."{c}" IS NOT s."{c}"' for c in colunas)
+    return conn.execute(f'''
+        UPDATE {TABLE_NAME} AS e SET {atribuicoes}
+        FROM staging AS s
+        WHERE s.rowid > ? AND s.rowid <= ?
+          AND s._chave = {chave_tabela} AND ({diferencas})
+    ''', (de, ate)).rowcount
+
+
+def _inserir_novos(conn, colunas, de, ate):
+    chave_tabela = expressao_chave_equipamento('e.')
+    colunas_sql = ", ".join(f'"{c}"' for c in colunas)
+    return conn.execute(f'''
+        INSERT INTO {TABLE_NAME} ({colunas_sql})
+        SELECT {colunas_sql} FROM staging s
+        WHERE s.rowid > ? AND s.rowid <= ?
+          AND NOT EXISTS (SELECT 1 FROM {TABLE_NAME} e WHERE {chave_tabela} = s._chave)
+    ''', (de, ate)).rowcount
+
+
+def _aplicar_diferencas(conn, colunas, tamanho_lote=TAMANHO_LOTE_DIFERENCAS):
+    """
+    Compara a tabela temporária 'staging' com a tabela de equipamentos pela
+    chave natural e aplica só as diferenças, em transações de 'tamanho_lote'
+    linhas. Devolve (inseridos, atualizados, removidos).
+    """
+    removidos = atualizados = inseridos = 0
+    # As remoções percorrem a tabela antes das inserções, que só acrescentam linhas no fim
+    for de, ate in _em_lotes(conn, TABLE_NAME, tamanho_lote):
+        removidos += _gravar_lote(conn, _remover_ausentes, de, ate)
+    for de, ate in _em_lotes(conn, 'staging', tamanho_lote):
+        atualizados += _gravar_lote(conn, _atualizar_alterados, colunas, de, ate)
+        inseridos += _gravar_lote(conn, _inserir_novos, colunas, de, ate)
+    return inseridos, atualizados, removidos
+
+
+def importar_csv_incremental(tamanho_bloco=TAMANHO_BLOCO, tamanho_lote=TAMANHO_LOTE_DIFERENCAS):
+    """
+    Importa o CSV de forma incremental: lê-o em blocos de 'tamanho_bloco'
+    linhas para uma tabela temporária e aplica à tabela 'equipamentos'
+    apenas as inserções, atualizações e remoções necessárias, em transações
+    curtas de 'tamanho_lote' linhas, para que a aplicação possa registar
+    chamados durante a importação. Os equipamentos são identificados pelo
+    Patrimonio (ou pelo IMEI1, quando não há património). A memória usada
+    não depende do tamanho do ficheiro. Uma importação interrompida pode ser
+    repetida: só aplica o que ficou por aplicar.
+    """
+    if not os.path.exists(CSV_FILE_PATH):
+        print(f"Erro: O ficheiro '{CSV_FILE_PATH}' não foi encontrado.")
+        print("Por favor, certifique-se de que o ficheiro está na mesma pasta que este script.")
+        return
+
+    try:
+        print(f"A conectar-se à base de dados '{DB_FILE_PATH}'...")
+        conn = abrir_conexao(DB_FILE_PATH)
+        aplicar_migracoes(conn)
+
+        colunas = [info[1] for info in conn.execute(f"PRAGMA table_info({TABLE_NAME})")]
+        if not colunas:
+            conn.close()
+            print(f"A tabela '{TABLE_NAME}' ainda não existe; a fazer uma importação completa.")
+            importar_csv_para_sqlite(tamanho_bloco)
+            return
+
+        colunas_csv = list(pd.read_csv(CSV_FILE_PATH, sep=';', dtype=str, nrows=0).columns.str.strip())
+        if sorted(colunas_csv) != sorted(colunas) or 'Patrimonio' not in colunas or 'IMEI1' not in colunas:
+            conn.close()
+            print("Erro: As colunas do CSV não correspondem às da tabela de equipamentos.")
+            print("Execute uma importação completa (sem --incremental) para recriar a tabela.")
+            return
+
+        colunas_sql = ", ".join(f'"{c}"' for c in colunas)
+        conn.execute(f"CREATE TEMP TABLE staging AS SELECT {colunas_sql}, NULL AS _chave FROM {TABLE_NAME} WHERE 0")
+
+        print(f"A ler dados de '{CSV_FILE_PATH}' em blocos de {tamanho_bloco} linhas...")
+        lidas = ignoradas = 0
+        marcadores = ", ".join("?" for _ in range(len(colunas) + 1))
+        for bloco in _ler_blocos_csv(tamanho_bloco):
+            patrimonio = bloco['Patrimonio']
+            bloco['_chave'] = patrimonio.where(patrimonio.notna() & (patrimonio != ''), bloco['IMEI1'])
+            sem_chave = bloco['_chave'].isna() | (bloco['_chave'] == '')
+            ignoradas += int(sem_chave.sum())
+            bloco = bloco.loc[~sem_chave, colunas + ['_chave']].astype(object)
+            bloco = bloco.where(bloco.notna(), None)
+            conn.executemany(f"INSERT INTO staging VALUES ({marcadores})", bloco.itertuples(index=False, name=None))
+            lidas += len(bloco)
+        print(f"{lidas} linhas lidas com sucesso.")
+
+        # Em caso de chave repetida no CSV, prevalece a última linha
+        conn.execute("CREATE INDEX temp.idx_staging_chave ON staging (_chave)")
+        conn.execute("DELETE FROM staging WHERE rowid NOT IN (SELECT MAX(rowid) FROM staging GROUP BY _chave)")
+        conn.commit()
+
+        print(f"A aplicar as diferenças à tabela '{TABLE_NAME}'...")
+        try:
+            inseridos, atualizados, removidos = _aplicar_diferencas(conn, colunas, tamanho_lote)
+        finally:
+            conn.execute("DROP TABLE temp.staging")
+            conn.close()
+
+        print("\n--- SUCESSO! ---")
+        print(f"Inseridos: {inseridos} | Atualizados: {atualizados} | Removidos: {removidos}"
+              f" | Ignorados (sem Patrimonio nem IMEI1): {ignoradas}")
+
+    except Exception as e:
+        print(f"\n--- ERRO ---")
+        print(f"Ocorreu um erro durante a importação: {e}")
+
+
 if __name__ == "__main__":
-    importar_csv_para_sqlite()
+    parser = argparse.ArgumentParser(description="Importa o CSV de equipamentos para a base de dados.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="aplica só as diferenças em vez de substituir a tabela inteira")
+    parser.add_argument('--reverter', action='store_true',
+                        help="repõe a tabela de equipamentos da importação anterior")
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO,
+                        help="linhas do CSV lidas de cada vez")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_DIFERENCAS,
+                        help="linhas comparadas por transação na importação incremental")
+    args = parser.parse_args()
+
+    if args.reverter:
+        reverter_importacao()
+    elif args.incremental:
+        importar_csv_incremental(args.bloco, args.lote)
+    else:
+        importar_csv_para_sqlite(args.bloco)
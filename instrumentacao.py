@@ -0,0 +1,214 @@
+# instrumentacao.py
+# Medição dos caminhos quentes: tempo de cada função de acesso aos dados e de
+# cada secção da interface, linhas lidas e registo das consultas lentas com o
+# respetivo EXPLAIN QUERY PLAN. Não depende do Streamlit.
+import collections
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# --- CONFIGURAÇÕES ---
+# Ficheiro JSON-lines (rotativo) com o resumo de cada rerun e as consultas lentas
+FICHEIRO_LOG = os.environ.get('SUPORTE_LOG_DESEMPENHO', 'desempenho.jsonl')
+TAMANHO_MAX_LOG = 5 * 1024 * 1024
+COPIAS_LOG = 3
+# Uma função de dados mais lenta do que isto tem as suas consultas registadas
+LIMIAR_LENTO_MS = float(os.environ.get('SUPORTE_LIMIAR_LENTO_MS', '100'))
+# Consultas lentas mais recentes mantidas em memória para o painel de administração
+MAX_CONSULTAS_LENTAS = 50
+# Número máximo de consultas de uma função lenta cujo plano é registado
+MAX_PLANOS_POR_FUNCAO = 10
+
+_local = threading.local()
+_consultas_lentas = collections.deque(maxlen=MAX_CONSULTAS_LENTAS)
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def _obter_logger():
+    # Criado no primeiro registo, para que importar o módulo não crie ficheiros
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger('suporte.desempenho')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            if not logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(FICHEIRO_LOG, maxBytes=TAMANHO_MAX_LOG,
+                                                               backupCount=COPIAS_LOG, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+            _logger = logger
+        return _logger
+
+
+def _registar(tipo, **dados):
+    registo = {'data': datetime.now().isoformat(timespec='milliseconds'), 'tipo': tipo}
+    registo.update(dados)
+    try:
+        _obter_logger().info(json.dumps(registo, ensure_ascii=False, default=str))
+    except OSError:
+        # Um disco cheio ou sem permissões não pode impedir a aplicação de responder
+        pass
+
+
+# --- MEDIÇÃO DE UM RERUN ---
+
+class Medicao:
+    """
+    Tempos de um rerun (ou de uma tarefa em lote): secções da interface,
+    marcadas em sequência com seccao(), e funções de dados instrumentadas.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.inicio = time.perf_counter()
+        self.seccoes = []
+        self.funcoes = {}
+        self._seccao_atual = None
+
+    def seccao(self, nome):
+        # Fecha a secção anterior e abre 'nome'; assim marca-se o script sem o reindentar
+        agora = time.perf_counter()
+        self._fechar_seccao(agora)
+        self._seccao_atual = (nome, agora)
+
+    def _fechar_seccao(self, agora):
+        if self._seccao_atual is not None:
+            nome, inicio = self._seccao_atual
+            self.seccoes.append((nome, (agora - inicio) * 1000))
+            self._seccao_atual = None
+
+    def registar_funcao(self, nome, duracao_ms, linhas):
+        chamadas, total_ms, total_linhas = self.funcoes.get(nome, (0, 0.0, 0))
+        self.funcoes[nome] = (chamadas + 1, total_ms + duracao_ms, total_linhas + linhas)
+
+    def total_ms(self):
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def resumo(self):
+        return {
+            'nome': self.nome,
+            'total_ms': round(self.total_ms(), 2),
+            'seccoes': {nome: round(ms, 2) for nome, ms in self.seccoes},
+            'funcoes': {nome: {'chamadas': chamadas, 'ms': round(ms, 2), 'linhas': linhas}
+                        for nome, (chamadas, ms, linhas) in self.funcoes.items()},
+        }
+
+
+def iniciar_medicao(nome):
+    """Começa a medição do rerun (ou tarefa) atual nesta thread e devolve-a."""
+    _local.medicao = Medicao(nome)
+    return _local.medicao
+
+
+def medicao_atual():
+    return getattr(_local, 'medicao', None)
+
+
+def seccao(nome):
+    medicao = medicao_atual()
+    if medicao is not None:
+        medicao.seccao(nome)
+
+
+def terminar_medicao():
+    # Fecha a última secção e grava o resumo no log; devolve o resumo
+    medicao = medicao_atual()
+    if medicao is None:
+        return None
+    medicao._fechar_seccao(time.perf_counter())
+    resumo = medicao.resumo()
+    _registar('rerun', **resumo)
+    return resumo
+
+
+# --- FUNÇÕES DE DADOS ---
+
+def registar_instrucao(caminho, sql):
+    # Callback de trace das conexões SQLite: guarda as instruções da função em curso
+    instrucoes = getattr(_local, 'instrucoes', None)
+    if instrucoes is not None:
+        instrucoes.append((caminho, sql))
+
+
+def rastrear_conexao(conn, caminho):
+    """Liga o trace de uma conexão do pool às medições (usar como 'ao_abrir' do PoolConexoes)."""
+    conn.set_trace_callback(functools.partial(registar_instrucao, caminho))
+
+
+def _contar_linhas(resultado):
+    # DataFrames e listas contam as linhas; um registo conta 1; tuplos somam as partes
+    if resultado is None:
+        return 0
+    if isinstance(resultado, tuple):
+        return sum(_contar_linhas(parte) for parte in resultado if hasattr(parte, '__len__'))
+    if hasattr(resultado, '__len__') and not isinstance(resultado, str):
+        return len(resultado)
+    return 1
+
+
+def _planos(lidas):
+    # EXPLAIN QUERY PLAN das leituras, numa conexão só de leitura, à parte das do pool
+    planos = []
+    for caminho, sql in lidas:
+        try:
+            conn = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+            try:
+                linhas = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            finally:
+                conn.close()
+            planos.append({'sql': sql, 'plano': [linha[-1] for linha in linhas]})
+        except sqlite3.Error as e:
+            planos.append({'sql': sql, 'erro': str(e)})
+    return planos
+
+
+def consultas_lentas():
+    # Da mais recente para a mais antiga
+    return list(reversed(_consultas_lentas))
+
+
+def instrumentado(funcao):
+    """
+    Decorador das funções de acesso aos dados: mede a duração e as linhas
+    devolvidas (somadas à medição do rerun atual, se houver) e, acima de
+    LIMIAR_LENTO_MS, regista as consultas executadas com o plano de cada uma.
+    """
+
+    @functools.wraps(funcao)
+    def wrapper(*args, **kwargs):
+        anteriores = getattr(_local, 'instrucoes', None)
+        _local.instrucoes = []
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args, **kwargs)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            instrucoes = _local.instrucoes
+            _local.instrucoes = anteriores
+            if anteriores is not None:
+                # Função chamada por outra instrumentada: as consultas contam também para esta
+                anteriores.extend(instrucoes)
+
+        linhas = _contar_linhas(resultado)
+        medicao = medicao_atual()
+        if medicao is not None:
+            medicao.registar_funcao(funcao.__name__, duracao_ms, linhas)
+
+        if duracao_ms >= LIMIAR_LENTO_MS:
+            lidas = [(caminho, sql) for caminho, sql in instrucoes
+                     if sql.lstrip().upper().startswith(('SELECT', 'WITH'))]
+            registo = {'funcao': funcao.__name__, 'ms': round(duracao_ms, 2), 'linhas': linhas,
+                       'consultas': _planos(lidas[:MAX_PLANOS_POR_FUNCAO])}
+            _consultas_lentas.append(dict(registo, data=datetime.now().isoformat(timespec='seconds')))
+            _registar('consulta_lenta', **registo)
+        return resultado
+
+    return wrapper
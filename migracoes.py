@@ -0,0 +1,554 @@
+# migracoes.py
+import sqlite3
+from datetime import datetime
+
+# --- CONFIGURAÇÕES ---
+TABELA_EQUIPAMENTOS = 'equipamentos'
+# Nomes possíveis da coluna de municípios, por ordem de preferência
+COLUNAS_MUNICIPIO = ['Município', 'Municipio']
+
+
+# --- ÍNDICES ---
+
+def expressao_chave_equipamento(prefixo=''):
+    # Chave natural de um equipamento: o património ou, na sua falta, o IMEI1
+    return f'COALESCE(NULLIF({prefixo}"Patrimonio", \'\'), {prefixo}"IMEI1")'
+
+
+def criar_indices_equipamentos(conn, tabela=TABELA_EQUIPAMENTOS):
+    """
+    Cria os índices da tabela de equipamentos, caso a tabela exista.
+    É chamada pelas migrações e pelo script de importação, já que este
+    recria a tabela (e os seus índices) a cada importação.
+    """
+    colunas = [info[1] for info in conn.execute(f'PRAGMA table_info("{tabela}")')]
+    if not colunas:
+        return
+
+    municipio_col = next((nome for nome in COLUNAS_MUNICIPIO if nome in colunas), None)
+    if municipio_col:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{tabela}_municipio" ON "{tabela}" ("{municipio_col}")')
+    if 'Patrimonio' in colunas:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{tabela}_patrimonio" ON "{tabela}" ("Patrimonio")')
+    if 'IMEI1' in colunas:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{tabela}_imei1" ON "{tabela}" ("IMEI1")')
+    if 'IMEI2' in colunas:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{tabela}_imei2" ON "{tabela}" ("IMEI2")')
+    if 'Patrimonio' in colunas and 'IMEI1' in colunas:
+        # Usado pela importação incremental para comparar a tabela com o CSV
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{tabela}_chave" ON "{tabela}" ({expressao_chave_equipamento()})')
+
+
+# --- PASSOS DE MIGRAÇÃO ---
+# Cada passo recebe uma conexão e tem de ser idempotente: pode correr sobre
+# bases de dados criadas antes da existência da tabela 'schema_version'.
+
+def _criar_tabela_chamados(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chamados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            municipio TEXT,
+            imei1 TEXT,
+            imei2 TEXT,
+            marca TEXT,
+            modelo TEXT,
+            capacidade TEXT,
+            entrega TEXT,
+            local_uso TEXT,
+            situacao_equipamento TEXT,
+            patrimonio TEXT,
+            solicitante_nome TEXT,
+            solicitante_telefone TEXT,
+            tipo_problema TEXT,
+            relato_problema TEXT
+        )
+    ''')
+
+
+def _adicionar_status_e_solucao(conn):
+    existing_columns = [info[1] for info in conn.execute("PRAGMA table_info(chamados)")]
+
+    if 'status' not in existing_columns:
+        conn.execute("ALTER TABLE chamados ADD COLUMN status TEXT DEFAULT 'Aberto'")
+    if 'solucao' not in existing_columns:
+        conn.execute("ALTER TABLE chamados ADD COLUMN solucao TEXT DEFAULT ''")
+
+
+def _criar_indices_chamados(conn):
+    # Listagem por município, da mais recente para a mais antiga
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_id ON chamados (municipio, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_status ON chamados (status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_patrimonio ON chamados (patrimonio)")
+
+
+def _criar_indices_equipamentos(conn):
+    criar_indices_equipamentos(conn)
+
+
+def _criar_indices_filtros_chamados(conn):
+    # Filtros da listagem paginada: município + status/tipo, ordenados por ID
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_status_id ON chamados (municipio, status, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_tipo_id ON chamados (municipio, tipo_problema, id DESC)")
+
+
+def _criar_tabela_metadados(conn):
+    # Contadores de geração: cada escrita incrementa o respetivo contador e as
+    # caches da aplicação comparam-no para saber se têm de recarregar os dados.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metadados (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO metadados (chave, valor) VALUES ('geracao_equipamentos', 0)")
+    conn.execute("INSERT OR IGNORE INTO metadados (chave, valor) VALUES ('geracao_chamados', 0)")
+
+
+def _criar_indices_acesso_direto(conn):
+    # Equipamentos por IMEI2 e chamados em aberto de um equipamento por IMEI1
+    criar_indices_equipamentos(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_imei1 ON chamados (imei1)")
+
+
+def _criar_pesquisa_texto_chamados(conn):
+    # Índice FTS5 próprio (não 'external content'), com rowid = chamados.id e
+    # sem acentos, mantido em sincronia pelos triggers abaixo.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chamados_fts USING fts5(
+            relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute("DELETE FROM chamados_fts")
+    conn.execute('''
+        INSERT INTO chamados_fts (rowid, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio)
+        SELECT id, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio FROM chamados
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_fts_ai AFTER INSERT ON chamados BEGIN
+            INSERT INTO chamados_fts (rowid, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio)
+            VALUES (new.id, new.relato_problema, new.solucao, new.tipo_problema, new.solicitante_nome, new.patrimonio);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_fts_au
+        AFTER UPDATE OF relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio ON chamados BEGIN
+            DELETE FROM chamados_fts WHERE rowid = old.id;
+            INSERT INTO chamados_fts (rowid, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio)
+            VALUES (new.id, new.relato_problema, new.solucao, new.tipo_problema, new.solicitante_nome, new.patrimonio);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_fts_ad AFTER DELETE ON chamados BEGIN
+            DELETE FROM chamados_fts WHERE rowid = old.id;
+        END
+    ''')
+
+
+def _criar_triggers_pesquisa_chamados(conn):
+    # O património passou para a tabela 'dispositivos': os triggers vão buscá-lo lá
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_fts_ai AFTER INSERT ON chamados BEGIN
+            INSERT INTO chamados_fts (rowid, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio)
+            VALUES (new.id, new.relato_problema, new.solucao, new.tipo_problema, new.solicitante_nome,
+                    (SELECT patrimonio FROM dispositivos WHERE id = new.dispositivo_id));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_fts_au
+        AFTER UPDATE OF relato_problema, solucao, tipo_problema, solicitante_nome, dispositivo_id ON chamados BEGIN
+            DELETE FROM chamados_fts WHERE rowid = old.id;
+            INSERT INTO chamados_fts (rowid, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio)
+            VALUES (new.id, new.relato_problema, new.solucao, new.tipo_problema, new.solicitante_nome,
+                    (SELECT patrimonio FROM dispositivos WHERE id = new.dispositivo_id));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_fts_ad AFTER DELETE ON chamados BEGIN
+            DELETE FROM chamados_fts WHERE rowid = old.id;
+        END
+    ''')
+
+
+def _criar_indices_chamados_normalizados(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_id ON chamados (municipio, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_status ON chamados (status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_status_id ON chamados (municipio, status, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_tipo_id ON chamados (municipio, tipo_problema, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_dispositivo ON chamados (dispositivo_id)")
+    # Pesquisa dos dispositivos pelo património e pelo IMEI1 (a chave já tem índice próprio)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dispositivos_patrimonio ON dispositivos (patrimonio)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dispositivos_imei1 ON dispositivos (imei1)")
+
+
+def _normalizar_chamados(conn):
+    """
+    Os dados do equipamento deixam de ser copiados para cada chamado: passam
+    para a tabela 'dispositivos' (chave substituta 'id', única pela chave
+    natural: património ou, na sua falta, IMEI1), referenciada por
+    chamados.dispositivo_id. A tabela 'equipamentos' não serve para isto
+    porque é substituída a cada importação (os rowids mudam).
+
+    Só o município e a situação do equipamento ficam no chamado, como
+    retrato do momento em que foi aberto. A vista 'vw_chamados' mantém os
+    nomes de colunas antigos para os leitores.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dispositivos (
+            id INTEGER PRIMARY KEY,
+            chave TEXT NOT NULL UNIQUE,
+            imei1 TEXT,
+            imei2 TEXT,
+            marca TEXT,
+            modelo TEXT,
+            capacidade TEXT,
+            entrega TEXT,
+            local_uso TEXT,
+            patrimonio TEXT
+        )
+    ''')
+    colunas = [info[1] for info in conn.execute("PRAGMA table_info(chamados)")]
+    if 'dispositivo_id' in colunas:
+        return
+
+    # Versões antigas gravavam 'nan' quando o equipamento não tinha património;
+    # passa a vazio, para a chave ser o IMEI1 e não juntar equipamentos diferentes.
+    conn.execute("UPDATE chamados SET patrimonio = '' WHERE patrimonio = 'nan'")
+    # Dos chamados mais recentes para os mais antigos: fica a última versão de cada equipamento
+    conn.execute('''
+        INSERT OR IGNORE INTO dispositivos (chave, imei1, imei2, marca, modelo, capacidade, entrega, local_uso, patrimonio)
+        SELECT COALESCE(NULLIF(patrimonio, ''), imei1, ''), imei1, imei2, marca, modelo, capacidade, entrega,
+               local_uso, patrimonio
+        FROM chamados ORDER BY id DESC
+    ''')
+    conn.execute('''
+        CREATE TABLE chamados_normalizados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            dispositivo_id INTEGER REFERENCES dispositivos (id),
+            municipio TEXT,
+            situacao_equipamento TEXT,
+            solicitante_nome TEXT,
+            solicitante_telefone TEXT,
+            tipo_problema TEXT,
+            relato_problema TEXT,
+            status TEXT DEFAULT 'Aberto',
+            solucao TEXT DEFAULT ''
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO chamados_normalizados (id, timestamp, dispositivo_id, municipio, situacao_equipamento,
+                                           solicitante_nome, solicitante_telefone, tipo_problema, relato_problema,
+                                           status, solucao)
+        SELECT c.id, c.timestamp, d.id, c.municipio, c.situacao_equipamento, c.solicitante_nome,
+               c.solicitante_telefone, c.tipo_problema, c.relato_problema, c.status, c.solucao
+        FROM chamados c JOIN dispositivos d ON d.chave = COALESCE(NULLIF(c.patrimonio, ''), c.imei1, '')
+    ''')
+
+    # Os triggers da pesquisa e os índices antigos desaparecem com a tabela
+    for trigger in ('chamados_fts_ai', 'chamados_fts_au', 'chamados_fts_ad'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE chamados")
+    conn.execute("ALTER TABLE chamados_normalizados RENAME TO chamados")
+
+    _criar_indices_chamados_normalizados(conn)
+    _criar_triggers_pesquisa_chamados(conn)
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS vw_chamados AS
+        SELECT c.id, c.timestamp, c.municipio, d.imei1, d.imei2, d.marca, d.modelo, d.capacidade, d.entrega,
+               d.local_uso, c.situacao_equipamento, d.patrimonio, c.solicitante_nome, c.solicitante_telefone,
+               c.tipo_problema, c.relato_problema, c.status, c.solucao, c.dispositivo_id
+        FROM chamados c LEFT JOIN dispositivos d ON d.id = c.dispositivo_id
+    ''')
+    conn.execute("ANALYZE")
+
+
+def _sql_somar_estatistica(registo, parcela):
+    # Soma 'parcela' (1 ou -1) ao grupo do chamado 'registo' ('new' ou 'old') num trigger
+    grupo = (f"COALESCE({registo}.municipio, ''), COALESCE({registo}.status, ''), "
+             f"COALESCE({registo}.tipo_problema, ''), COALESCE(substr({registo}.timestamp, 1, 10), '')")
+    return f'''
+        INSERT INTO estatisticas_chamados (municipio, status, tipo_problema, dia, total)
+        VALUES ({grupo}, {parcela})
+        ON CONFLICT (municipio, status, tipo_problema, dia) DO UPDATE SET total = total + excluded.total;
+        DELETE FROM estatisticas_chamados
+        WHERE (municipio, status, tipo_problema, dia) = ({grupo}) AND total = 0;
+    '''
+
+
+def _criar_estatisticas_chamados(conn):
+    """
+    Tabela resumo com o número de chamados por (município, status, tipo de
+    problema, dia de abertura), mantida pelos triggers de chamados. O painel
+    de estatísticas lê só esta tabela, cujo tamanho depende do número de
+    grupos e não do histórico de chamados.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS estatisticas_chamados (
+            municipio TEXT NOT NULL,
+            status TEXT NOT NULL,
+            tipo_problema TEXT NOT NULL,
+            dia TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (municipio, status, tipo_problema, dia)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_estatisticas_chamados_dia ON estatisticas_chamados (dia)")
+    conn.execute("DELETE FROM estatisticas_chamados")
+    conn.execute('''
+        INSERT INTO estatisticas_chamados (municipio, status, tipo_problema, dia, total)
+        SELECT COALESCE(municipio, ''), COALESCE(status, ''), COALESCE(tipo_problema, ''),
+               COALESCE(substr(timestamp, 1, 10), ''), COUNT(*)
+        FROM chamados GROUP BY 1, 2, 3, 4
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS estatisticas_chamados_ai AFTER INSERT ON chamados BEGIN
+            {_sql_somar_estatistica('new', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS estatisticas_chamados_au
+        AFTER UPDATE OF municipio, status, tipo_problema, timestamp ON chamados
+        WHEN (old.municipio, old.status, old.tipo_problema, old.timestamp)
+             IS NOT (new.municipio, new.status, new.tipo_problema, new.timestamp) BEGIN
+            {_sql_somar_estatistica('old', -1)}
+            {_sql_somar_estatistica('new', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS estatisticas_chamados_ad AFTER DELETE ON chamados BEGIN
+            {_sql_somar_estatistica('old', -1)}
+        END
+    ''')
+
+
+def _criar_arquivo_chamados(conn):
+    """
+    Tabela 'chamados_arquivo' para os chamados encerrados antigos, que o
+    arquivamento tira da tabela 'chamados' para esta continuar pequena. Tem
+    as mesmas colunas e mantém o ID (o AUTOINCREMENT de 'chamados' nunca o
+    volta a dar). Os triggers mantêm os arquivados na pesquisa de texto e
+    nas estatísticas: a saída de 'chamados' desconta-os, a entrada aqui
+    volta a contá-los. A vista 'vw_chamados_todos' junta as duas tabelas.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chamados_arquivo (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT,
+            dispositivo_id INTEGER REFERENCES dispositivos (id),
+            municipio TEXT,
+            situacao_equipamento TEXT,
+            solicitante_nome TEXT,
+            solicitante_telefone TEXT,
+            tipo_problema TEXT,
+            relato_problema TEXT,
+            status TEXT,
+            solucao TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_arquivo_municipio_id ON chamados_arquivo (municipio, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_arquivo_dispositivo ON chamados_arquivo (dispositivo_id)")
+    # Encontra os encerrados a arquivar sem percorrer os chamados em aberto
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_status_timestamp ON chamados (status, timestamp)")
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_arquivo_fts_ai AFTER INSERT ON chamados_arquivo BEGIN
+            INSERT INTO chamados_fts (rowid, relato_problema, solucao, tipo_problema, solicitante_nome, patrimonio)
+            VALUES (new.id, new.relato_problema, new.solucao, new.tipo_problema, new.solicitante_nome,
+                    (SELECT patrimonio FROM dispositivos WHERE id = new.dispositivo_id));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS chamados_arquivo_fts_ad AFTER DELETE ON chamados_arquivo BEGIN
+            DELETE FROM chamados_fts WHERE rowid = old.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS estatisticas_chamados_arquivo_ai AFTER INSERT ON chamados_arquivo BEGIN
+            {_sql_somar_estatistica('new', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS estatisticas_chamados_arquivo_ad AFTER DELETE ON chamados_arquivo BEGIN
+            {_sql_somar_estatistica('old', -1)}
+        END
+    ''')
+
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS vw_chamados_todos AS
+        SELECT * FROM vw_chamados
+        UNION ALL
+        SELECT c.id, c.timestamp, c.municipio, d.imei1, d.imei2, d.marca, d.modelo, d.capacidade, d.entrega,
+               d.local_uso, c.situacao_equipamento, d.patrimonio, c.solicitante_nome, c.solicitante_telefone,
+               c.tipo_problema, c.relato_problema, c.status, c.solucao, c.dispositivo_id
+        FROM chamados_arquivo c LEFT JOIN dispositivos d ON d.id = c.dispositivo_id
+    ''')
+
+
+def _adicionar_epoch_chamados(conn):
+    """
+    Colunas inteiras em segundos desde 1970 (UTC): 'ts', o momento de
+    abertura (o mesmo instante do 'timestamp' em texto, que está na hora
+    local), e 'encerrado_ts', o momento em que o chamado foi encerrado. Os
+    filtros por período passam a ser intervalos num índice em vez de
+    comparações de texto. O momento de encerramento dos chamados já
+    encerrados não é conhecido e fica NULL.
+    """
+    for tabela in ('chamados', 'chamados_arquivo'):
+        colunas = [info[1] for info in conn.execute(f"PRAGMA table_info({tabela})")]
+        if 'ts' not in colunas:
+            conn.execute(f"ALTER TABLE {tabela} ADD COLUMN ts INTEGER")
+        if 'encerrado_ts' not in colunas:
+            conn.execute(f"ALTER TABLE {tabela} ADD COLUMN encerrado_ts INTEGER")
+        # O modificador 'utc' converte da hora local, tal como datetime.timestamp() no Python
+        conn.execute(f"UPDATE {tabela} SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) WHERE ts IS NULL")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_municipio_ts ON chamados (municipio, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_status_ts ON chamados (status, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_encerrado_ts ON chamados (encerrado_ts) "
+                 "WHERE encerrado_ts IS NOT NULL")
+    # No arquivo, que é a tabela grande, as janelas recentes sem município também usam um índice
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_arquivo_ts ON chamados_arquivo (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_arquivo_encerrado_ts ON chamados_arquivo (encerrado_ts) "
+                 "WHERE encerrado_ts IS NOT NULL")
+    # O arquivamento passa a procurar por (status, ts)
+    conn.execute("DROP INDEX IF EXISTS idx_chamados_status_timestamp")
+
+    # As vistas listam as colunas uma a uma: são recriadas com as novas
+    conn.execute("DROP VIEW IF EXISTS vw_chamados_todos")
+    conn.execute("DROP VIEW IF EXISTS vw_chamados")
+    conn.execute('''
+        CREATE VIEW vw_chamados AS
+        SELECT c.id, c.timestamp, c.municipio, d.imei1, d.imei2, d.marca, d.modelo, d.capacidade, d.entrega,
+               d.local_uso, c.situacao_equipamento, d.patrimonio, c.solicitante_nome, c.solicitante_telefone,
+               c.tipo_problema, c.relato_problema, c.status, c.solucao, c.dispositivo_id, c.ts, c.encerrado_ts
+        FROM chamados c LEFT JOIN dispositivos d ON d.id = c.dispositivo_id
+    ''')
+    conn.execute('''
+        CREATE VIEW vw_chamados_todos AS
+        SELECT * FROM vw_chamados
+        UNION ALL
+        SELECT c.id, c.timestamp, c.municipio, d.imei1, d.imei2, d.marca, d.modelo, d.capacidade, d.entrega,
+               d.local_uso, c.situacao_equipamento, d.patrimonio, c.solicitante_nome, c.solicitante_telefone,
+               c.tipo_problema, c.relato_problema, c.status, c.solucao, c.dispositivo_id, c.ts, c.encerrado_ts
+        FROM chamados_arquivo c LEFT JOIN dispositivos d ON d.id = c.dispositivo_id
+    ''')
+    conn.execute("ANALYZE")
+
+
+def _adicionar_versao_chamados(conn):
+    """
+    Coluna 'versao', incrementada a cada alteração de um chamado: quem edita
+    guarda a versão que leu e a alteração só é aceite se ainda for a atual
+    (concorrência otimista), em vez de apagar o que outro operador gravou.
+    """
+    for tabela in ('chamados', 'chamados_arquivo'):
+        colunas = [info[1] for info in conn.execute(f"PRAGMA table_info({tabela})")]
+        if 'versao' not in colunas:
+            conn.execute(f"ALTER TABLE {tabela} ADD COLUMN versao INTEGER NOT NULL DEFAULT 1")
+
+    conn.execute("DROP VIEW IF EXISTS vw_chamados_todos")
+    conn.execute("DROP VIEW IF EXISTS vw_chamados")
+    conn.execute('''
+        CREATE VIEW vw_chamados AS
+        SELECT c.id, c.timestamp, c.municipio, d.imei1, d.imei2, d.marca, d.modelo, d.capacidade, d.entrega,
+               d.local_uso, c.situacao_equipamento, d.patrimonio, c.solicitante_nome, c.solicitante_telefone,
+               c.tipo_problema, c.relato_problema, c.status, c.solucao, c.dispositivo_id, c.ts, c.encerrado_ts,
+               c.versao
+        FROM chamados c LEFT JOIN dispositivos d ON d.id = c.dispositivo_id
+    ''')
+    conn.execute('''
+        CREATE VIEW vw_chamados_todos AS
+        SELECT * FROM vw_chamados
+        UNION ALL
+        SELECT c.id, c.timestamp, c.municipio, d.imei1, d.imei2, d.marca, d.modelo, d.capacidade, d.entrega,
+               d.local_uso, c.situacao_equipamento, d.patrimonio, c.solicitante_nome, c.solicitante_telefone,
+               c.tipo_problema, c.relato_problema, c.status, c.solucao, c.dispositivo_id, c.ts, c.encerrado_ts,
+               c.versao
+        FROM chamados_arquivo c LEFT JOIN dispositivos d ON d.id = c.dispositivo_id
+    ''')
+
+
+def _criar_indice_arquivamento(conn):
+    """
+    O arquivamento mede a idade de um chamado a partir do encerramento (ou da
+    abertura, quando o momento de encerramento não é conhecido): o índice
+    sobre essa mesma expressão permite escolher cada lote sem varrer os
+    chamados encerrados.
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamados_status_fechado_ts "
+                 "ON chamados (status, COALESCE(encerrado_ts, ts))")
+    conn.execute("ANALYZE")
+
+
+def _atualizar_estatisticas(conn):
+    # Dá ao planeador de consultas estatísticas sobre os novos índices
+    conn.execute("ANALYZE")
+
+
+# Lista ordenada de (versão, descrição, função). Novas migrações são sempre
+# acrescentadas no fim, com a versão seguinte; nunca se altera um passo já publicado.
+MIGRACOES = [
+    (1, "Cria a tabela chamados", _criar_tabela_chamados),
+    (2, "Adiciona as colunas status e solucao", _adicionar_status_e_solucao),
+    (3, "Índices da tabela chamados", _criar_indices_chamados),
+    (4, "Índices da tabela equipamentos", _criar_indices_equipamentos),
+    (5, "Estatísticas do planeador de consultas", _atualizar_estatisticas),
+    (6, "Índices dos filtros da listagem de chamados", _criar_indices_filtros_chamados),
+    (7, "Tabela metadados com os contadores de geração", _criar_tabela_metadados),
+    (8, "Índice da chave natural dos equipamentos", _criar_indices_equipamentos),
+    (9, "Pesquisa de texto (FTS5) nos chamados", _criar_pesquisa_texto_chamados),
+    (10, "Índices do acesso direto por IMEI e Património", _criar_indices_acesso_direto),
+    (11, "Chamados referenciam a tabela dispositivos; vista vw_chamados", _normalizar_chamados),
+    (12, "Tabela estatisticas_chamados mantida por triggers", _criar_estatisticas_chamados),
+    (13, "Arquivo dos chamados encerrados; vista vw_chamados_todos", _criar_arquivo_chamados),
+    (14, "Colunas ts e encerrado_ts (epoch) com índices por período", _adicionar_epoch_chamados),
+    (15, "Coluna versao dos chamados (concorrência otimista)", _adicionar_versao_chamados),
+    (16, "Índice do arquivamento pela data de encerramento", _criar_indice_arquivamento),
+]
+
+
+# --- MOTOR DE MIGRAÇÕES ---
+
+def _versao_atual(conn):
+    return conn.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_version").fetchone()[0]
+
+
+def aplicar_migracoes(conn):
+    """
+    Aplica, por ordem, todas as migrações ainda não registadas na tabela
+    'schema_version'. Cada passo corre na sua própria transação, juntamente
+    com o respetivo registo, pelo que uma falha não deixa a versão a meio.
+    Devolve a versão final do esquema.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TEXT
+        )
+    ''')
+
+    for versao, descricao, funcao in MIGRACOES:
+        if versao <= _versao_atual(conn):
+            continue
+
+        # BEGIN IMMEDIATE reserva a escrita; outro processo que esteja a migrar
+        # ao mesmo tempo espera e volta a verificar a versão em baixo.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if versao <= _versao_atual(conn):
+                conn.rollback()
+                continue
+            funcao(conn)
+            conn.execute(
+                "INSERT INTO schema_version (versao, descricao, aplicada_em) VALUES (?, ?, ?)",
+                (versao, descricao, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    return _versao_atual(conn)
@@ -0,0 +1,814 @@
+# repositorio.py
+# Acesso aos dados de chamados e equipamentos, sem dependência do Streamlit:
+# pode ser usado pela aplicação, por scripts e por tarefas em lote.
+# O pandas só é importado dentro das leituras em massa, para não atrasar o
+# arranque de quem só faz leituras pontuais ou escritas.
+import math
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import date, datetime, timedelta
+
+from base_dados import (DB_FILE_PATH, GERACAO_CHAMADOS, EscritorDedicado, PoolConexoes, com_retentativa,
+                        incrementar_geracao, ler_geracoes)
+from instrumentacao import instrumentado, rastrear_conexao
+from migracoes import COLUNAS_MUNICIPIO, TABELA_EQUIPAMENTOS, aplicar_migracoes
+
+# --- VALORES FIXOS DOS CHAMADOS ---
+STATUS_CHAMADO = ["Aberto", "Aguardando solução", "Encerrado"]
+TIPOS_PROBLEMA = ["Ajuda aplicativo", "Suporte técnico", "Roubo", "Outros"]
+# Número de chamados por página quando não é indicado outro
+TAMANHO_PAGINA_PADRAO = 25
+# Formato da coluna 'timestamp' (hora local); a coluna 'ts' guarda o mesmo instante em segundos desde 1970
+FORMATO_TIMESTAMP = "%Y-%m-%d %H:%M:%S"
+# Colunas da tabela resumo pelas quais as estatísticas podem ser agrupadas
+COLUNAS_ESTATISTICAS = ['municipio', 'status', 'tipo_problema', 'dia']
+
+# --- CONFIGURAÇÕES DOS EQUIPAMENTOS ---
+# Coluna da tabela 'equipamentos' -> atributo de Equipamento (o município é tratado à parte)
+CAMPOS_EQUIPAMENTO = {
+    'IMEI1': 'imei1',
+    'IMEI2': 'imei2',
+    'Marca': 'marca',
+    'Modelo': 'modelo',
+    'Capacidade': 'capacidade',
+    'Entrega': 'entrega',
+    'Local de Uso': 'local_uso',
+    'Situação': 'situacao',
+    'Patrimonio': 'patrimonio',
+}
+# Colunas com identificadores únicos usados no acesso direto a um equipamento
+COLUNAS_IDENTIFICADORES = ['IMEI1', 'IMEI2', 'Patrimonio']
+# Número máximo de equipamentos devolvidos por uma pesquisa por prefixo
+MAX_RESULTADOS_ACESSO_DIRETO = 20
+# Colunas obrigatórias do CSV de registo de chamados em lote (além de Patrimonio ou IMEI1)
+COLUNAS_CSV_LOTE = ['Solicitante', 'Telefone', 'Tipo de Problema', 'Relato']
+# Número máximo de valores por consulta 'IN (...)'
+TAMANHO_BLOCO_IN = 500
+# Colunas de baixa cardinalidade guardadas como 'category' na tabela completa
+COLUNAS_CATEGORICAS = COLUNAS_MUNICIPIO + ['Marca', 'Modelo', 'Capacidade', 'Entrega', 'Situação', 'Local de Uso']
+# Linhas lidas de cada vez na exportação de chamados
+TAMANHO_BLOCO_EXPORTACAO = 10000
+
+
+# --- DATAS ---
+# Os filtros por período comparam a coluna 'ts' (segundos desde 1970) com a
+# meia-noite local dos dias pedidos.
+
+def _inicio_do_dia(dia):
+    # 'AAAA-MM-DD' (ou date) -> epoch da meia-noite local desse dia, para comparar com 'ts'
+    if isinstance(dia, str):
+        dia = date.fromisoformat(dia)
+    return int(datetime.combine(dia, datetime.min.time()).timestamp())
+
+
+def _intervalo_ts(desde=None, ate=None):
+    # Condições SQL e parâmetros para os chamados abertos entre os dias 'desde' e 'ate', ambos incluídos
+    condicoes = []
+    params = []
+    if desde:
+        condicoes.append("ts >= ?")
+        params.append(_inicio_do_dia(desde))
+    if ate:
+        if isinstance(ate, str):
+            ate = date.fromisoformat(ate)
+        condicoes.append("ts < ?")
+        params.append(_inicio_do_dia(ate + timedelta(days=1)))
+    return condicoes, params
+
+
+# --- REGISTOS ---
+# Leituras pontuais devolvem estes registos compactos (com __slots__) em vez
+# de um DataFrame de uma linha; o pandas fica para as leituras em massa.
+
+def _texto(valor):
+    # Valores em falta (NULL do SQLite ou NaN do pandas) passam a texto vazio
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ''
+    return str(valor)
+
+
+@dataclass(slots=True, frozen=True)
+class Equipamento:
+    municipio: str
+    imei1: str
+    imei2: str
+    marca: str
+    modelo: str
+    capacidade: str
+    entrega: str
+    local_uso: str
+    situacao: str
+    patrimonio: str
+
+    @classmethod
+    def de_linha(cls, linha, municipio_col_name):
+        """Cria o registo a partir de uma linha (dict, Series ou sqlite3.Row) da tabela de equipamentos."""
+        linha = dict(linha) if isinstance(linha, sqlite3.Row) else linha
+        return cls(
+            municipio=_texto(linha[municipio_col_name]),
+            **{atributo: _texto(linha.get(coluna)) for coluna, atributo in CAMPOS_EQUIPAMENTO.items()}
+        )
+
+    @property
+    def chave(self):
+        # Chave natural do dispositivo: o património ou, na sua falta, o IMEI1
+        return self.patrimonio or self.imei1
+
+    def como_dicionario(self):
+        # Com os nomes das colunas originais, para apresentação
+        dados = {'Município': self.municipio}
+        dados.update({coluna: getattr(self, atributo) for coluna, atributo in CAMPOS_EQUIPAMENTO.items()})
+        return dados
+
+
+@dataclass(slots=True, frozen=True)
+class Chamado:
+    id: int
+    timestamp: str
+    municipio: str
+    imei1: str
+    imei2: str
+    marca: str
+    modelo: str
+    capacidade: str
+    entrega: str
+    local_uso: str
+    situacao_equipamento: str
+    patrimonio: str
+    solicitante_nome: str
+    solicitante_telefone: str
+    tipo_problema: str
+    relato_problema: str
+    status: str
+    solucao: str
+    # Incrementada a cada alteração; ver update_chamado_details
+    versao: int
+
+    @classmethod
+    def de_linha(cls, linha):
+        return cls(**{campo.name: linha[campo.name] for campo in fields(cls)})
+
+    def como_dicionario(self):
+        return {campo.name: getattr(self, campo.name) for campo in fields(self)}
+
+
+class ConflitoVersao(Exception):
+    """O chamado foi alterado por outra pessoa depois de 'versao_lida' ter sido lida."""
+
+    def __init__(self, chamado_id, versao_lida, versao_atual):
+        super().__init__(f"O chamado {chamado_id} foi alterado entretanto "
+                         f"(versão lida {versao_lida}, versão atual {versao_atual}).")
+        self.chamado_id = chamado_id
+        self.versao_lida = versao_lida
+        self.versao_atual = versao_atual
+
+
+# --- CONEXÃO ---
+_pool = None
+_escritor = None
+_pool_lock = threading.Lock()
+
+
+def obter_pool():
+    # Um único pool por processo, criado no primeiro uso
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolConexoes(DB_FILE_PATH, ao_abrir=rastrear_conexao)
+        return _pool
+
+
+def obter_escritor():
+    # Todas as escritas de chamados do processo passam por esta thread
+    global _escritor
+    caminho = obter_pool().caminho
+    with _pool_lock:
+        if _escritor is None:
+            _escritor = EscritorDedicado(caminho, ao_abrir=rastrear_conexao)
+        return _escritor
+
+
+def configurar_base_dados(caminho):
+    """Passa a usar a base de dados em 'caminho' (útil para scripts e testes)."""
+    global _pool, _escritor
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+        if _escritor is not None:
+            _escritor.fechar()
+        _pool = PoolConexoes(caminho, ao_abrir=rastrear_conexao)
+        _escritor = EscritorDedicado(caminho, ao_abrir=rastrear_conexao)
+
+
+@instrumentado
+def inicializar_base_dados():
+    # O esquema (tabelas, colunas e índices) é gerido pelas migrações versionadas
+    with obter_pool().conexao() as conn:
+        aplicar_migracoes(conn)
+
+
+@instrumentado
+def obter_geracoes():
+    with obter_pool().conexao() as conn:
+        return ler_geracoes(conn)
+
+
+# --- ESCRITA DE CHAMADOS ---
+# O dispositivo é criado (ou atualizado) pela chave natural e o chamado
+# referencia-o pelo id; só o município e a situação ficam no próprio chamado.
+SQL_GUARDAR_DISPOSITIVO = '''
+    INSERT INTO dispositivos (chave, imei1, imei2, marca, modelo, capacidade, entrega, local_uso, patrimonio)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (chave) DO UPDATE SET
+        imei1 = excluded.imei1, imei2 = excluded.imei2, marca = excluded.marca, modelo = excluded.modelo,
+        capacidade = excluded.capacidade, entrega = excluded.entrega, local_uso = excluded.local_uso,
+        patrimonio = excluded.patrimonio
+    WHERE (dispositivos.imei1, dispositivos.imei2, dispositivos.marca, dispositivos.modelo, dispositivos.capacidade,
+           dispositivos.entrega, dispositivos.local_uso, dispositivos.patrimonio)
+       IS NOT (excluded.imei1, excluded.imei2, excluded.marca, excluded.modelo, excluded.capacidade,
+               excluded.entrega, excluded.local_uso, excluded.patrimonio)
+'''
+
+# Colunas da tabela chamados (e de chamados_arquivo), para copiar linhas entre as duas
+COLUNAS_TABELA_CHAMADOS = ('id, timestamp, dispositivo_id, municipio, situacao_equipamento, solicitante_nome, '
+                           'solicitante_telefone, tipo_problema, relato_problema, status, solucao, ts, encerrado_ts, '
+                           'versao')
+
+SQL_INSERIR_CHAMADO = '''
+    INSERT INTO chamados (
+        timestamp, ts, dispositivo_id, municipio, situacao_equipamento,
+        solicitante_nome, solicitante_telefone, tipo_problema, relato_problema, status, solucao
+    ) VALUES (?, ?, (SELECT id FROM dispositivos WHERE chave = ?), ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+SQL_ATUALIZAR_CHAMADO = '''
+    UPDATE chamados
+    SET status = ?, solucao = ?,
+        encerrado_ts = CASE WHEN ? = 'Encerrado' THEN COALESCE(encerrado_ts, ?) END,
+        versao = versao + 1
+    WHERE id = ?
+'''
+
+
+def _linha_dispositivo(equipamento):
+    return (
+        equipamento.chave,
+        equipamento.imei1,
+        equipamento.imei2,
+        equipamento.marca,
+        equipamento.modelo,
+        equipamento.capacidade,
+        equipamento.entrega,
+        equipamento.local_uso,
+        equipamento.patrimonio,
+    )
+
+
+def _linha_chamado(equipamento, dados_formulario, momento):
+    # 'momento' é um datetime na hora local
+    return (
+        momento.strftime(FORMATO_TIMESTAMP),
+        int(momento.timestamp()),
+        equipamento.chave,
+        equipamento.municipio,
+        equipamento.situacao,
+        dados_formulario['nome'],
+        dados_formulario['telefone'],
+        dados_formulario['tipo_problema'],
+        dados_formulario['relato'],
+        'Aberto',  # Status inicial
+        ''  # Solução inicial vazia
+    )
+
+
+@instrumentado
+@com_retentativa
+def save_chamado(equipamento, dados_formulario):
+    now = datetime.now()
+    data_to_insert = _linha_chamado(equipamento, dados_formulario, now)
+    obter_escritor().executar(_inserir_chamados, [_linha_dispositivo(equipamento)], [data_to_insert])
+
+
+@instrumentado
+@com_retentativa
+def save_chamados_em_lote(df_lote, municipio_col_name):
+    """
+    Regista um chamado por linha de 'df_lote' (colunas do equipamento mais
+    Solicitante, Telefone, Tipo de Problema e Relato) numa única transação.
+    Devolve o número de chamados criados.
+    """
+    now = datetime.now()
+    registos = [(Equipamento.de_linha(registo, municipio_col_name), registo) for registo in df_lote.to_dict('records')]
+    linhas = [
+        _linha_chamado(equipamento, {
+            "nome": registo['Solicitante'],
+            "telefone": registo['Telefone'],
+            "tipo_problema": registo['Tipo de Problema'],
+            "relato": registo['Relato']
+        }, now)
+        for equipamento, registo in registos
+    ]
+    if not linhas:
+        return 0
+
+    dispositivos = {equipamento.chave: _linha_dispositivo(equipamento) for equipamento, _ in registos}
+    obter_escritor().executar(_inserir_chamados, list(dispositivos.values()), linhas)
+    return len(linhas)
+
+
+def _inserir_chamados(conn, dispositivos, linhas):
+    # Corre no escritor dedicado, dentro da transação do lote
+    conn.executemany(SQL_GUARDAR_DISPOSITIVO, dispositivos)
+    conn.executemany(SQL_INSERIR_CHAMADO, linhas)
+    incrementar_geracao(conn, GERACAO_CHAMADOS)
+
+
+@instrumentado
+@com_retentativa
+def update_chamado_details(chamado_id, novo_status, nova_solucao, versao=None):
+    """
+    Altera o status e a solução de um chamado e devolve a nova versão.
+    Com 'versao' (a versão lida quando a edição começou), a alteração só é
+    gravada se ninguém tiver alterado o chamado entretanto; caso contrário
+    levanta ConflitoVersao. Sem 'versao', grava sempre.
+    """
+    return obter_escritor().executar(_atualizar_chamado, chamado_id, novo_status, nova_solucao, versao)
+
+
+def _atualizar_chamado(conn, chamado_id, novo_status, nova_solucao, versao):
+    # Corre no escritor dedicado: entre a leitura da versão e o UPDATE nenhuma outra escrita é possível
+    arquivado = False
+    linha = conn.execute("SELECT versao FROM chamados WHERE id = ?", (chamado_id,)).fetchone()
+    if linha is None:
+        linha = conn.execute("SELECT versao FROM chamados_arquivo WHERE id = ?", (chamado_id,)).fetchone()
+        arquivado = linha is not None
+    if linha is None:
+        raise ValueError(f"O chamado {chamado_id} não existe.")
+    if versao is not None and linha[0] != versao:
+        raise ConflitoVersao(chamado_id, versao, linha[0])
+
+    if arquivado:
+        # Chamado arquivado: volta à tabela principal já alterado; se continuar
+        # encerrado, o próximo arquivamento devolve-o ao arquivo.
+        _mover_chamados(conn, 'chamados_arquivo', 'chamados', [chamado_id])
+    # O momento do encerramento fica o da primeira vez que passa a 'Encerrado'; uma reabertura apaga-o
+    conn.execute(SQL_ATUALIZAR_CHAMADO, (novo_status, nova_solucao, novo_status, int(time.time()), chamado_id))
+    incrementar_geracao(conn, GERACAO_CHAMADOS)
+    return linha[0] + 1
+
+
+def _mover_chamados(conn, origem, destino, ids):
+    # Apaga primeiro e insere depois: os triggers das duas tabelas usam o mesmo
+    # rowid no índice FTS, que só pode existir uma vez.
+    marcadores = ', '.join('?' * len(ids))
+    cursor = conn.execute(f"SELECT {COLUNAS_TABELA_CHAMADOS} FROM {origem} WHERE id IN ({marcadores})", ids)
+    linhas = cursor.fetchall()
+    conn.execute(f"DELETE FROM {origem} WHERE id IN ({marcadores})", ids)
+    valores = ', '.join('?' * len(cursor.description))
+    conn.executemany(f"INSERT INTO {destino} ({COLUNAS_TABELA_CHAMADOS}) VALUES ({valores})", linhas)
+
+
+@instrumentado
+@com_retentativa
+def arquivar_chamados_encerrados(encerrados_antes_de, limite=TAMANHO_BLOCO_IN):
+    """
+    Move para 'chamados_arquivo' até 'limite' chamados encerrados antes do
+    dia 'encerrados_antes_de' ('AAAA-MM-DD'), numa transação curta. Os
+    chamados sem momento de encerramento conhecido contam pela abertura.
+    Devolve o número de chamados arquivados; 0 quando não há mais nenhum.
+    """
+    return obter_escritor().executar(_arquivar_chamados, _inicio_do_dia(encerrados_antes_de), limite)
+
+
+def _arquivar_chamados(conn, limite_ts, limite):
+    # No escritor dedicado a transação já é IMMEDIATE: os IDs escolhidos não mudam antes da cópia
+    ids = [linha[0] for linha in conn.execute(
+        "SELECT id FROM chamados WHERE status = 'Encerrado' AND COALESCE(encerrado_ts, ts) < ? "
+        "ORDER BY COALESCE(encerrado_ts, ts) LIMIT ?", (limite_ts, limite))]
+    if ids:
+        _mover_chamados(conn, 'chamados', 'chamados_arquivo', ids)
+        incrementar_geracao(conn, GERACAO_CHAMADOS)
+    return len(ids)
+
+
+# --- LEITURA DE CHAMADOS ---
+
+@instrumentado
+def carregar_chamados_por_municipio(municipio, status=None, tipo_problema=None, antes_de_id=None,
+                                    limite=TAMANHO_PAGINA_PADRAO, incluir_arquivo=False, desde=None, ate=None):
+    import pandas as pd
+
+    # Paginação por chave (keyset): cada página começa logo abaixo do último ID
+    # da anterior, pelo que o custo não depende de quantas páginas ficaram para trás.
+    condicoes = ["municipio = ?"]
+    params = [municipio]
+    if status:
+        condicoes.append("status = ?")
+        params.append(status)
+    if tipo_problema:
+        condicoes.append("tipo_problema = ?")
+        params.append(tipo_problema)
+    if antes_de_id is not None:
+        condicoes.append("id < ?")
+        params.append(int(antes_de_id))
+    # Período de abertura (dias 'AAAA-MM-DD' ou date, ambos incluídos), pelo índice (municipio, ts)
+    condicoes_periodo, params_periodo = _intervalo_ts(desde, ate)
+    condicoes += condicoes_periodo
+    params += params_periodo
+    params.append(limite)
+
+    with obter_pool().conexao() as conn:
+        # Com o arquivo, o SQLite junta as duas tabelas já ordenadas pelo ID (MERGE)
+        vista = "vw_chamados_todos" if incluir_arquivo else "vw_chamados"
+        query = f"SELECT id as ID, timestamp as Data, patrimonio as Património, tipo_problema as Problema, relato_problema as Relato, status as Status FROM {vista} WHERE {' AND '.join(condicoes)} ORDER BY id DESC LIMIT ?"
+        return pd.read_sql_query(query, conn, params=params)
+
+
+@instrumentado
+def contar_chamados(municipio, incluir_arquivo=False):
+    with obter_pool().conexao() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM chamados WHERE municipio = ?", (municipio,)).fetchone()[0]
+        if incluir_arquivo:
+            total += conn.execute("SELECT COUNT(*) FROM chamados_arquivo WHERE municipio = ?",
+                                  (municipio,)).fetchone()[0]
+        return total
+
+
+def _expressao_pesquisa(termo):
+    # Cada palavra vira um prefixo entre aspas, o que evita erros de sintaxe
+    # do FTS5 com o texto escrito pelo utilizador; as palavras são combinadas com AND.
+    palavras = re.findall(r'\w+', termo)
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+@instrumentado
+def pesquisar_chamados(termo, pagina=0, limite=TAMANHO_PAGINA_PADRAO):
+    """
+    Pesquisa em todos os municípios, incluindo os chamados arquivados, no
+    relato, solução, tipo de problema, solicitante e património. Devolve
+    (página de resultados ordenada por relevância, total de resultados).
+    """
+    import pandas as pd
+
+    expressao = _expressao_pesquisa(termo)
+    if not expressao:
+        return pd.DataFrame(), 0
+
+    with obter_pool().conexao() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM chamados_fts WHERE chamados_fts MATCH ?", (expressao,)).fetchone()[0]
+        # A página sai primeiro do índice FTS e só depois se vai buscar cada chamado
+        # à tabela onde estiver; juntar a vista vw_chamados_todos obrigaria o
+        # SQLite a materializá-la por inteiro.
+        query = '''
+            WITH pagina AS (
+                SELECT rowid AS id, snippet(chamados_fts, -1, '**', '**', '…', 12) AS trecho, rank
+                FROM chamados_fts
+                WHERE chamados_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            )
+            SELECT p.id as ID, COALESCE(h.timestamp, a.timestamp) as Data,
+                   COALESCE(h.municipio, a.municipio) as Município, d.patrimonio as Património,
+                   COALESCE(h.tipo_problema, a.tipo_problema) as Problema, p.trecho as Trecho,
+                   COALESCE(h.status, a.status) as Status
+            FROM pagina p
+            LEFT JOIN chamados h ON h.id = p.id
+            LEFT JOIN chamados_arquivo a ON a.id = p.id
+            LEFT JOIN dispositivos d ON d.id = COALESCE(h.dispositivo_id, a.dispositivo_id)
+            ORDER BY p.rank
+        '''
+        df_resultados = pd.read_sql_query(query, conn, params=(expressao, limite, pagina * limite))
+        return df_resultados, total
+
+
+@instrumentado
+def carregar_detalhes_chamado(chamado_id):
+    # Leitura pontual: devolve um Chamado (ou None), sem passar pelo pandas; procura também no arquivo
+    with obter_pool().conexao() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        linha = cursor.execute("SELECT * FROM vw_chamados_todos WHERE id = ?", (chamado_id,)).fetchone()
+        return Chamado.de_linha(linha) if linha is not None else None
+
+
+@instrumentado
+def carregar_chamados_abertos_equipamento(chave):
+    import pandas as pd
+
+    with obter_pool().conexao() as conn:
+        # Só pela chave natural: há IMEI1 repetidos (truncados) entre dispositivos diferentes
+        query = '''
+            SELECT id as ID, timestamp as Data, patrimonio as Património, tipo_problema as Problema,
+                   relato_problema as Relato, status as Status
+            FROM vw_chamados
+            WHERE dispositivo_id = (SELECT id FROM dispositivos WHERE chave = ?)
+              AND status != 'Encerrado'
+            ORDER BY id DESC
+        '''
+        # Uma chave vazia passa a NULL para não coincidir com os dispositivos sem identificadores
+        return pd.read_sql_query(query, conn, params=(chave or None,))
+
+
+@instrumentado
+def carregar_chamados_ultimos_dias(dias, encerrados=False, municipio=None, limite=None):
+    """
+    Chamados abertos (ou, com encerrados=True, encerrados) nos últimos 'dias'
+    dias, incluindo os arquivados, do mais recente para o mais antigo e
+    opcionalmente só de um município. A janela é um intervalo nos índices
+    de 'ts' / 'encerrado_ts'; os chamados encerrados antes de haver a coluna
+    'encerrado_ts' não têm momento de encerramento e não aparecem.
+    """
+    import pandas as pd
+
+    coluna = "encerrado_ts" if encerrados else "ts"
+    condicoes = [f"{coluna} >= ?"]
+    params = [int(time.time()) - dias * 86400]
+    if municipio:
+        condicoes.append("municipio = ?")
+        params.append(municipio)
+    params.append(limite if limite is not None else -1)
+
+    with obter_pool().conexao() as conn:
+        query = f'''
+            SELECT id as ID, timestamp as Data, datetime(encerrado_ts, 'unixepoch', 'localtime') as Encerrado,
+                   municipio as Município, patrimonio as Património, tipo_problema as Problema, status as Status
+            FROM vw_chamados_todos
+            WHERE {' AND '.join(condicoes)}
+            ORDER BY {coluna} DESC
+            LIMIT ?
+        '''
+        return pd.read_sql_query(query, conn, params=params)
+
+
+# --- ESTATÍSTICAS DOS CHAMADOS ---
+
+@instrumentado
+def carregar_estatisticas(agrupar_por, municipio=None, desde=None, ate=None):
+    """
+    Número de chamados agrupado pelas colunas 'agrupar_por' (de
+    COLUNAS_ESTATISTICAS), opcionalmente só de um município e/ou dos chamados
+    abertos entre os dias 'desde' e 'ate' ('AAAA-MM-DD'). Lê apenas a tabela resumo
+    estatisticas_chamados, mantida pelos triggers, e nunca a tabela chamados.
+    """
+    import pandas as pd
+
+    invalidas = [coluna for coluna in agrupar_por if coluna not in COLUNAS_ESTATISTICAS]
+    if invalidas:
+        raise ValueError(f"Colunas de agrupamento inválidas: {', '.join(invalidas)}")
+
+    condicoes = []
+    params = []
+    if municipio:
+        condicoes.append("municipio = ?")
+        params.append(municipio)
+    if desde:
+        condicoes.append("dia >= ?")
+        params.append(desde)
+    if ate:
+        condicoes.append("dia <= ?")
+        params.append(ate)
+    onde = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    colunas = ", ".join(agrupar_por)
+    agrupamento = f"GROUP BY {colunas} ORDER BY {colunas}" if agrupar_por else ""
+    selecao = f"{colunas}, " if agrupar_por else ""
+
+    with obter_pool().conexao() as conn:
+        query = f"SELECT {selecao}SUM(total) as total FROM estatisticas_chamados {onde} {agrupamento}"
+        return pd.read_sql_query(query, conn, params=params)
+
+
+# --- EXPORTAÇÃO DE CHAMADOS ---
+# As colunas exportadas são as do registo Chamado, pela mesma ordem, sem a versão interna
+COLUNAS_EXPORTACAO = tuple(campo.name for campo in fields(Chamado) if campo.name != 'versao')
+
+
+def iterar_chamados_exportacao(municipio=None, status=None, desde=None, ate=None,
+                               tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Gerador dos chamados (incluindo os arquivados) que respeitam os filtros,
+    por ordem de ID, em blocos de até 'tamanho_bloco' tuplos com as
+    COLUNAS_EXPORTACAO. 'desde' e 'ate' são dias ('AAAA-MM-DD'), ambos incluídos.
+    Cada bloco é uma consulta curta que continua a partir do último ID do
+    anterior: a memória usada não depende do tamanho do histórico e um
+    consumidor lento (um download, por exemplo) não prende uma conexão do
+    pool nem impede o checkpoint do WAL entre blocos.
+    """
+    condicoes = ["id > ?"]
+    filtros = []
+    if municipio:
+        condicoes.append("municipio = ?")
+        filtros.append(municipio)
+    if status:
+        condicoes.append("status = ?")
+        filtros.append(status)
+    condicoes_periodo, params_periodo = _intervalo_ts(desde, ate)
+    condicoes += condicoes_periodo
+    filtros += params_periodo
+    query = (f"SELECT {', '.join(COLUNAS_EXPORTACAO)} FROM vw_chamados_todos "
+             f"WHERE {' AND '.join(condicoes)} ORDER BY id LIMIT ?")
+
+    ultimo_id = 0
+    while True:
+        with obter_pool().conexao() as conn:
+            bloco = conn.execute(query, [ultimo_id, *filtros, tamanho_bloco]).fetchall()
+        if not bloco:
+            return
+        yield bloco
+        if len(bloco) < tamanho_bloco:
+            return
+        ultimo_id = bloco[-1][0]
+
+
+# --- LEITURA DE EQUIPAMENTOS ---
+
+def _colunas_equipamentos(conn):
+    return [info[1] for info in conn.execute(f"PRAGMA table_info({TABELA_EQUIPAMENTOS})")]
+
+
+@instrumentado
+def tabela_equipamentos_existe():
+    with obter_pool().conexao() as conn:
+        return bool(_colunas_equipamentos(conn))
+
+
+@instrumentado
+def listar_municipios():
+    """
+    Devolve (nome da coluna de municípios, lista ordenada de municípios), lida
+    com um SELECT DISTINCT sobre o índice da coluna. A coluna é None se não
+    for encontrada.
+    """
+    with obter_pool().conexao() as conn:
+        municipio_col = next((nome for nome in COLUNAS_MUNICIPIO if nome in _colunas_equipamentos(conn)), None)
+        if municipio_col is None:
+            return None, []
+
+        cursor = conn.execute(
+            f'SELECT DISTINCT "{municipio_col}" FROM {TABELA_EQUIPAMENTOS} '
+            f'WHERE "{municipio_col}" IS NOT NULL ORDER BY "{municipio_col}"'
+        )
+        return municipio_col, [linha[0] for linha in cursor]
+
+
+@instrumentado
+def carregar_tabela_equipamentos():
+    import pandas as pd
+
+    with obter_pool().conexao() as conn:
+        df = pd.read_sql_query(f"SELECT * FROM {TABELA_EQUIPAMENTOS}", conn)
+
+    # Colunas repetitivas (município, marca, modelo...) passam a códigos
+    # inteiros + dicionário, o que reduz bastante a memória ocupada.
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
+    return df
+
+
+@instrumentado
+def carregar_equipamentos_municipio(municipio, municipio_col_name):
+    import pandas as pd
+
+    with obter_pool().conexao() as conn:
+        query = f'SELECT * FROM {TABELA_EQUIPAMENTOS} WHERE "{municipio_col_name}" = ?'
+        return pd.read_sql_query(query, conn, params=(municipio,))
+
+
+@instrumentado
+def construir_indice_identificadores():
+    """
+    Índice em memória (dicionário) de IMEI1, IMEI2 e Património para o rowid
+    dos equipamentos. Permite encontrar um equipamento pelo identificador
+    completo sem tocar na base de dados.
+    """
+    indice = {}
+    with obter_pool().conexao() as conn:
+        identificadores = [c for c in COLUNAS_IDENTIFICADORES if c in _colunas_equipamentos(conn)]
+        if not identificadores:
+            return indice
+        colunas_sql = ", ".join(f'"{c}"' for c in identificadores)
+        for rowid, *valores in conn.execute(f"SELECT rowid, {colunas_sql} FROM {TABELA_EQUIPAMENTOS}"):
+            for valor in valores:
+                if valor:
+                    indice.setdefault(valor, []).append(rowid)
+    return indice
+
+
+@instrumentado
+def carregar_equipamento(rowid):
+    # Leitura pontual: devolve um Equipamento (ou None), sem passar pelo pandas
+    with obter_pool().conexao() as conn:
+        municipio_col = next((nome for nome in COLUNAS_MUNICIPIO if nome in _colunas_equipamentos(conn)), None)
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        linha = cursor.execute(f"SELECT * FROM {TABELA_EQUIPAMENTOS} WHERE rowid = ?", (rowid,)).fetchone()
+        return Equipamento.de_linha(linha, municipio_col) if linha is not None and municipio_col else None
+
+
+@instrumentado
+def procurar_equipamentos(termo, indice=None):
+    """
+    Procura equipamentos em todo o estado pelo IMEI1, IMEI2 ou Património.
+    Um identificador completo é resolvido pelo índice em memória ('indice',
+    de construir_indice_identificadores); caso contrário, é tratado como
+    prefixo e pesquisado nos índices do SQLite.
+    """
+    import pandas as pd
+
+    termo = termo.strip()
+    if not termo:
+        return pd.DataFrame()
+
+    with obter_pool().conexao() as conn:
+        rowids = (indice or {}).get(termo)
+        if rowids:
+            marcadores = ", ".join("?" for _ in rowids)
+            query = f"SELECT * FROM {TABELA_EQUIPAMENTOS} WHERE rowid IN ({marcadores})"
+            return pd.read_sql_query(query, conn, params=rowids)
+
+        identificadores = [c for c in COLUNAS_IDENTIFICADORES if c in _colunas_equipamentos(conn)]
+        if not identificadores:
+            return pd.DataFrame()
+        # 'col >= termo AND col < termo + U+10FFFF' é um intervalo no índice de cada coluna
+        subconsultas = " UNION ".join(
+            f'SELECT * FROM {TABELA_EQUIPAMENTOS} WHERE "{c}" >= ? AND "{c}" < ?' for c in identificadores
+        )
+        params = [termo, termo + '\U0010ffff'] * len(identificadores) + [MAX_RESULTADOS_ACESSO_DIRETO]
+        return pd.read_sql_query(f"{subconsultas} LIMIT ?", conn, params=params)
+
+
+@instrumentado
+def carregar_equipamentos_por_identificador(coluna, valores):
+    import pandas as pd
+
+    # Uma consulta IN por bloco de valores, servida pelo índice da coluna
+    blocos = []
+    valores = list(dict.fromkeys(valores))
+    with obter_pool().conexao() as conn:
+        for inicio in range(0, len(valores), TAMANHO_BLOCO_IN):
+            bloco = valores[inicio:inicio + TAMANHO_BLOCO_IN]
+            marcadores = ", ".join("?" for _ in bloco)
+            query = f'SELECT * FROM {TABELA_EQUIPAMENTOS} WHERE "{coluna}" IN ({marcadores})'
+            blocos.append(pd.read_sql_query(query, conn, params=bloco))
+    if not blocos:
+        return pd.DataFrame()
+    return pd.concat(blocos, ignore_index=True).drop_duplicates(subset=[coluna])
+
+
+@instrumentado
+def validar_lote_csv(df_lote):
+    """
+    Valida de forma vetorizada um lote de chamados lido de CSV e associa a cada
+    linha o seu equipamento (pelo Patrimonio ou, na sua falta, pelo IMEI1).
+    Devolve (linhas válidas com os dados do equipamento, DataFrame de erros
+    com a linha do ficheiro e o motivo). Lança ValueError se faltarem colunas.
+    """
+    import pandas as pd
+
+    df_lote = df_lote.copy()
+    df_lote.columns = df_lote.columns.str.strip()
+    em_falta = [c for c in COLUNAS_CSV_LOTE if c not in df_lote.columns]
+    if 'Patrimonio' not in df_lote.columns and 'IMEI1' not in df_lote.columns:
+        em_falta.append('Patrimonio ou IMEI1')
+    if em_falta:
+        raise ValueError(f"Colunas em falta no ficheiro: {', '.join(em_falta)}")
+
+    for coluna in COLUNAS_CSV_LOTE + ['Patrimonio', 'IMEI1']:
+        if coluna not in df_lote.columns:
+            df_lote[coluna] = ''
+        df_lote[coluna] = df_lote[coluna].fillna('').astype(str).str.strip()
+    # Linha no ficheiro (a linha 1 é o cabeçalho)
+    df_lote['Linha'] = range(2, len(df_lote) + 2)
+
+    erros = []
+    incompletas = (df_lote[COLUNAS_CSV_LOTE] == '').any(axis=1)
+    erros.append(df_lote.loc[incompletas, ['Linha']].assign(Motivo="Campos obrigatórios em falta"))
+    tipo_invalido = ~incompletas & ~df_lote['Tipo de Problema'].isin(TIPOS_PROBLEMA)
+    erros.append(df_lote.loc[tipo_invalido, ['Linha']].assign(Motivo="Tipo de Problema inválido"))
+    sem_identificador = (df_lote['Patrimonio'] == '') & (df_lote['IMEI1'] == '')
+    erros.append(df_lote.loc[~incompletas & ~tipo_invalido & sem_identificador, ['Linha']]
+                 .assign(Motivo="Sem Patrimonio nem IMEI1"))
+    candidatas = df_lote[~incompletas & ~tipo_invalido & ~sem_identificador]
+
+    validos = []
+    por_patrimonio = candidatas['Patrimonio'] != ''
+    for coluna, linhas in (('Patrimonio', candidatas[por_patrimonio]), ('IMEI1', candidatas[~por_patrimonio])):
+        if linhas.empty:
+            continue
+        equipamentos = carregar_equipamentos_por_identificador(coluna, linhas[coluna].tolist())
+        if equipamentos.empty:
+            erros.append(linhas[['Linha']].assign(Motivo=f"Equipamento não encontrado ({coluna})"))
+            continue
+        unidas = linhas[['Linha', coluna] + COLUNAS_CSV_LOTE].merge(equipamentos, on=coluna, how='left',
+                                                                      indicator=True)
+        encontrado = unidas['_merge'] == 'both'
+        erros.append(unidas.loc[~encontrado, ['Linha']].assign(Motivo=f"Equipamento não encontrado ({coluna})"))
+        validos.append(unidas[encontrado].drop(columns='_merge'))
+
+    df_validos = pd.concat(validos, ignore_index=True).sort_values('Linha') if validos else pd.DataFrame()
+    df_erros = pd.concat(erros, ignore_index=True).sort_values('Linha')
+    return df_validos, df_erros
@@ -0,0 +1,42 @@
+# test_repositorio.py
+# Testes do módulo 'repositorio' sobre uma base de dados temporária.
+import pytest
+
+import repositorio
+from repositorio import Equipamento
+
+
+@pytest.fixture
+def base_dados(tmp_path):
+    repositorio.configurar_base_dados(str(tmp_path / 'chamados.db'))
+    repositorio.inicializar_base_dados()
+    yield
+    repositorio.configurar_base_dados(repositorio.DB_FILE_PATH)
+
+
+def _equipamento(municipio, patrimonio, imei1):
+    return Equipamento(municipio=municipio, imei1=imei1, imei2='', marca='Marca', modelo='Modelo',
+                       capacidade='', entrega='', local_uso='', situacao='', patrimonio=patrimonio)
+
+
+def _registar(equipamento, relato):
+    repositorio.save_chamado(equipamento, {'nome': 'Solicitante', 'telefone': '', 'tipo_problema': 'Outros',
+                                           'relato': relato})
+
+
+def test_chamados_abertos_de_dispositivos_com_o_mesmo_imei1(base_dados):
+    # IMEI1 truncados na planilha repetem-se entre dispositivos diferentes
+    primeiro = _equipamento('Agudos do Sul', '20305795478', '106029000000000')
+    segundo = _equipamento('Barracão', '27414501326', '106029000000000')
+    _registar(primeiro, 'do primeiro')
+    _registar(segundo, 'do segundo')
+
+    abertos = repositorio.carregar_chamados_abertos_equipamento(primeiro.chave)
+    assert abertos['Relato'].tolist() == ['do primeiro']
+    abertos = repositorio.carregar_chamados_abertos_equipamento(segundo.chave)
+    assert abertos['Relato'].tolist() == ['do segundo']
+
+
+def test_chamados_abertos_sem_chave(base_dados):
+    _registar(_equipamento('Abatiá', '', ''), 'sem identificadores')
+    assert repositorio.carregar_chamados_abertos_equipamento('').empty